@@ -10,44 +10,129 @@ http://opensource.org/licenses/MIT
 """
 from __future__ import absolute_import, print_function
 
+import bisect
+import contextvars
+import hashlib
+import importlib
+import json
+import math
 import os
+import random
 import re
+import struct
 import sys
+import threading
+import time
 import warnings
 from argparse import ArgumentParser
 from builtins import input
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from collections.abc import Mapping
+from contextlib import ExitStack, contextmanager
+from functools import partial
 from datetime import date
 from shutil import copyfile
-from joblib import Parallel, delayed
-
-import ads
-import bibtexparser
-import packaging.version
-import requests
 
 try:
-    from urllib.parse import unquote
+    from urllib.parse import parse_qs, unquote, urlparse
 except ImportError:
     from urllib import unquote
+    from urlparse import parse_qs, urlparse
 
 __version__ = "0.6.1"
 
+
+class _LazyModule(object):
+    # import the module on first attribute access, so that `adstex --help` and
+    # code paths that do not talk to ADS do not pay for importing heavy dependencies
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+ads = _LazyModule("ads")
+asyncio = _LazyModule("asyncio")
+bibtexparser = _LazyModule("bibtexparser")
+futures = _LazyModule("concurrent.futures")
+mmap = _LazyModule("mmap")
+multiprocessing = _LazyModule("multiprocessing")
+requests = _LazyModule("requests")
+sqlite3 = _LazyModule("sqlite3")
+
 _this_year = date.today().year % 100
 _this_cent = date.today().year // 100
 
-_re_comment = re.compile(r"(?<!\\)%.*(?=[\r\n])")
-_re_bib = re.compile(r"\\(?:no)?bibliography\*?(?:(?!\n{2,})\s)*{((?:(?!\n{2,})[^{}])+)}")
-_re_cite = re.compile(
-    r"\\(?:bibentry|[cC]ite[a-zA]{0,7})\*?(?:(?!\n{2,})\s)*(?:(?<!\\)[\[<](?:(?!\n{2,}).)*?(?<!\\)[\]>](?:(?!\n{2,})\s)*)*{((?:(?!\n{2,})[^{}])+)}",
-    re.S,
+# TeX scanning: one forward pass that stops only at the commands of interest,
+# at escaped "%" and at comments that may hide commands
+_tex_commands = r"bibentry|[cC]ite[a-zA]{0,7}|(?:no)?bibliography|input|include|subfile|(?:sub)?import"
+_re_tex_token = re.compile(
+    r"%[^\n\\]*\\[^\n]*"
+    r"|\\(?<!\\\\)(?:\\\\)*(?:%|(" + _tex_commands + r")(?![A-Za-z])"
+    # fast path for the common `\cite[..][..]{keys}` form
+    r"(?:\*?[ \t]*(?:\[[^\[\]<>{}%\\\n]*\][ \t]*)*{([^{}%\\\n]+)})?)"
 )
+_re_tex_comment = re.compile(r"%[^\n]*")
+_re_tex_space = re.compile(r"(?:[ \t\r\f\v]|\n(?!\n)|%[^\n]*(?=\n|\Z))*")
+_re_tex_group = re.compile(r"{((?:[^{}%\n]|\n(?!\n)|%[^\n]*(?=\n|\Z))+)}")
+_re_tex_bracket = re.compile(r"\\[^\n]|%[^\n]*|\n\n|[\[\]>]")
+_re_tex_command = re.compile(r"\\[A-Za-z]+\*?|[{}\[\]$~]")
+_re_cite_keys = re.compile(r"\\(?:[cC]ite[a-zA]{0,7}|bibentry)\*?\s*(?:\[[^\]]*\]\s*)*{([^{}]*)}")
+_re_bibtex_entry = re.compile(r"^@\w+\s*[{(]\s*([^,\s]+)\s*,", re.M)
+# bib scanning, as bibtexparser reads a file: a block may start right after the previous block ends,
+# even on the same line, but text outside blocks is a comment up to the next "@" that starts a line
+_re_bibtex_block_start = re.compile(r"\s*@\s*([A-Za-z]+)\s*([{(])")
+_re_bibtex_block_key = re.compile(r"\s*([^,\s]+)\s*,")
+_re_bibtex_next_line_block = re.compile(r"\n\s*@")
+_re_bibtex_delim = re.compile(r"[{}()]")
+_bibtex_delims = {"{": "{", "}": "}", "(": "(", ")": ")", b"{": "{", b"}": "}", b"(": "(", b")": ")"}
+_re_bibtex_id_field = re.compile(r"[\n,][ \t]*(adsurl|doi|eprint|url|pages)[ \t]*=[ \t]*[{\"]?[ \t]*([^{}\",\s]+)", re.I)
+_re_bytes = {}  # the bytes versions of the bib scanning patterns (see `_bib_re`)
 _re_fayear = re.compile(r"([A-Za-z-:]+)(?:(?=[\W_])[^\s\d,]+)?((?:\d{2})?\d{2})")
 _re_id = {}
 _re_id["doi"] = re.compile(r"\b10\.\d{4,}(?:\.\d+)*\/(?:(?!['\"&<>])\S)+\b")
 _re_id["bibcode"] = re.compile(r"\b\d{4}\D\S{13}[A-Z.:]\b")
 _re_id["arxiv"] = re.compile(r"\b(?:\d{4}\.\d{4,5}|[a-z-]+(?:\.[A-Za-z-]+)?\/\d{7})\b")
 
+# words too common to tell papers apart by their titles
+_stopwords = frozenset(
+    "about also although among based been before between both could does during each from have here however "
+    "into more most other over paper shown show since some such than that their them then there these they "
+    "this those through thus under using very were what when where which while with within work would".split()
+)
+
+_entry_id_fields = (
+    ("adsurl", "bibcode"),
+    ("doi", "doi"),
+    ("eprint", "arxiv"),
+    ("url", ("bibcode", "doi", "arxiv")),
+    ("pages", "arxiv"),
+)
+
+# number of identifiers sent in one batched ADS search
+_ID_CHUNK_SIZE = 40
+
+# number of bibcodes sent in one ADS export request
+_EXPORT_CHUNK_SIZE = 200
+
+# input files are parsed in a process pool only when there is at least this much to parse (in bytes)
+_PARALLEL_MIN_BYTES = 1 << 20
+
+# with a journal, identifiers are looked up (and recorded) in groups of this many keys
+_JOURNAL_GROUP_SIZE = 1000
+
+# retries of transient ADS failures, and the longest wait (in seconds) for a rate limit reset
+_ADS_RETRIES = 4
+_ADS_MAX_WAIT = 60
+_ADS_TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+# the ADS calls are blocking (ads and requests), so each call in flight takes a thread; at most this many
+_ADS_MAX_THREADS = 32
+
 _name_prefix = (
     "van",
     "di",
@@ -61,24 +146,546 @@ _name_prefix = (
 )
 _name_prefix = sorted(_name_prefix, key=len, reverse=True)
 
-# global configs
-_DATABASE = "astronomy"
-_DISABLE_SSL = False
-_USE_COAUTHORS = False
+# the `Config` of the current context (see `_config`)
+_CONFIG = contextvars.ContextVar("adstex_config", default=None)
+# the searches of the current run (a run of `main` or a call of `Resolver.resolve`), see `AdsClient.coalesce`
+_MEMO = contextvars.ContextVar("adstex_memo", default=None)
+_DEFAULT_CONFIG = None
+_STATS = None
+
+# default lifetime (in days) of each kind of cached ADS lookup
+_CACHE_TTL = {"id": 1, "authoryear": 7, "bibtex": 30, "tex": 365, "version": 1}
+# lifetime (in days) of the records kept in the cache that are not ADS lookups (when each bibcode was
+# last checked for updates, see `record_checked`); --cache-ttl, --refresh-cache and the trim do not apply to them
+_CACHE_RECORDS = {"checked": 365}
+
+# the journal part of the bibcodes of arXiv e-prints (including the old per-archive ones, e.g., astro-ph)
+_eprint_journals = (
+    "arXiv", "astro", "cond.", "gr.qc", "hep.e", "hep.l", "hep.p", "hep.t", "math.", "nlin.", "nucl.", "physi", "quant"
+)
+
+# in bib update mode, days between update checks of an existing entry, by the kind of its bibcode
+_RECHECK_DAYS = {"arxiv": 0, "in_press": 0, "unknown": 0, "recent": 7, "journal": 180}
+# ranking of author+year candidates (see `rank_candidates`): the weight of each signal in the score,
+# and the number of characters around a citation read for its context
+_RANK_WEIGHTS = {"citations": 1.0, "coauthors": 5.0, "title": 6.0, "other": 2.0, "taken": -6.0}
+_CONTEXT_WIDTH = 300
+# the confidence of the best candidate at which --auto-select picks it without asking
+_AUTO_THRESHOLD = 0.9
+
+# order in which the update checks of existing entries are kept under --max-requests
+_PLAN_PRIORITY = ("arxiv", "in_press", "unknown", "recent", "journal")
+_CACHE_MAX_ENTRIES = 20000
+
+# layout of ADS snapshot files (see `build_snapshot`)
+_SNAPSHOT_MAGIC = b"ADSTEXSN"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sIIQQQQQQ")
+_SNAPSHOT_RECORD = struct.Struct("<19sQI")
+_SNAPSHOT_SLOT = struct.Struct("<QII")
+
+# phases of a run, as timed by --stats and selectable by --profile
+_PHASES = ("scan_tex", "load_bib", "resolve", "interactive", "export", "write_bib")
+
+_Candidate = namedtuple("_Candidate", ("bibcode", "author", "title", "citation_count"))
+_KeyResult = namedtuple("_KeyResult", ("key", "status", "bibcode"))
+
+_key_status_messages = {
+    "update": "{key}: UPDATE => {bibcode}",
+    "update_other": "{key}: FOUND IN SECONDARY BIB SOURCES, UPDATE => {bibcode}",
+    "existing": "{key}: EXISTING",
+    "unchecked": "{key}: EXISTING (NOT CHECKED, ADS UNAVAILABLE)",
+    "fresh": "{key}: EXISTING (CHECKED RECENTLY)",
+    "deferred": "{key}: EXISTING (NOT CHECKED, OVER --max-requests)",
+    "merge": "{key}: FOUND IN OTHER BIB SOURCE, MERGED",
+    "ignore": "{key}: FOUND IN OTHER BIB SOURCE, IGNORED",
+    "new": "{key}: NEW ENTRY => {bibcode}",
+    "unavailable": "{key}: ADS UNAVAILABLE",
+}
+
+
+def _cache_dir():
+    path = os.getenv("ADSTEX_CACHE_DIR")
+    if not path:
+        path = os.path.join(
+            os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+            "adstex",
+        )
+    return path
+
+
+class AdsCache(object):
+    """
+    SQLite-backed cache of ADS lookups (identifier -> bibcode,
+    author+year search -> candidates, bibcode -> bibtex).
+    Each kind has its own TTL (in days); each kind is trimmed to
+    `max_entries` least recently used rows when the cache is closed.
+    With `refresh=True`, cached values are ignored but new results are still stored.
+    The records of `_CACHE_RECORDS` keep their own TTL, and are neither refreshed nor trimmed.
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=_CACHE_MAX_ENTRIES, refresh=False):
+        if path is None:
+            path = os.path.join(_cache_dir(), "cache.sqlite")
+        dirpath = os.path.dirname(path)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        self.ttl = dict(_CACHE_TTL)
+        self.ttl.update(ttl or {})
+        self.ttl.update(_CACHE_RECORDS)
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (kind TEXT NOT NULL, key TEXT NOT NULL, "
+            "value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+
+    def _expired_before(self, kind):
+        ttl = self.ttl.get(kind)
+        return 0 if ttl is None else time.time() - ttl * 86400.0
+
+    def get_many(self, kind, keys):
+        found = {}
+        keys = list(keys)
+        if (self.refresh and kind not in _CACHE_RECORDS) or not keys:
+            self.misses[kind] += len(keys)
+            return found
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    "SELECT key, value FROM cache WHERE kind = ? AND created >= ? AND key IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    [kind, self._expired_before(kind)] + chunk,
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            self.hits[kind] += len(found)
+            self.misses[kind] += len(keys) - len(found)
+            if found:
+                now = time.time()
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "UPDATE cache SET accessed = ? WHERE kind = ? AND key = ?",
+                    [(now, kind, key) for key in found],
+                )
+                self._conn.execute("COMMIT")
+        return found
+
+    def get(self, kind, key, default=None):
+        return self.get_many(kind, [key]).get(key, default)
+
+    def set_many(self, kind, items):
+        now = time.time()
+        rows = [(kind, key, json.dumps(value), now, now) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def set(self, kind, key, value):
+        self.set_many(kind, [(key, value)])
+
+    def close(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for kind in self.ttl:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE kind = ? AND created < ?",
+                    (kind, self._expired_before(kind)),
+                )
+            for (kind,) in self._conn.execute("SELECT DISTINCT kind FROM cache").fetchall():
+                if kind in _CACHE_RECORDS:
+                    continue
+                self._conn.execute(
+                    "DELETE FROM cache WHERE kind = ? AND key NOT IN "
+                    "(SELECT key FROM cache WHERE kind = ? ORDER BY accessed DESC LIMIT ?)",
+                    (kind, kind, self.max_entries),
+                )
+            self._conn.execute("COMMIT")
+            self._conn.close()
+
+
+def _cache_get_many(kind, keys):
+    cache = _config().cache
+    if cache is None:
+        return {}
+    return cache.get_many(kind, keys)
+
+
+def _cache_set_many(kind, items):
+    cache = _config().cache
+    if cache is not None:
+        cache.set_many(kind, items)
+
+
+def _local_id2bibcodes(ids):
+    # identifier -> bibcode, for the identifiers found in the snapshot or the cache
+    resolved = {}
+    snapshot = _config().snapshot
+    if snapshot is not None:
+        for id_this in ids:
+            bibcode = snapshot.id2bibcode(id_this)
+            if bibcode:
+                resolved[id_this] = bibcode
+    resolved.update(_cache_get_many("id", [id_this for id_this in ids if id_this not in resolved]))
+    return resolved
+
+
+class AdsUnavailableError(Exception):
+    pass
+
+
+def _request_kind(request):
+    url = urlparse(request.url)
+    if url.path.rstrip("/").rsplit("/", 2)[-2:-1] == ["export"]:
+        return "export"
+    q = parse_qs(url.query).get("q", [""])[0]
+    return "identifier" if q.startswith("identifier:") else "authoryear"
+
+
+class AdsClient(object):
+    """
+    Pooled keep-alive HTTP sessions to ADS, shared by all queries, and an
+    asyncio engine that keeps up to `max_concurrency` ADS calls in flight.
+    The calls themselves are blocking and run in a pool of `max_concurrency`
+    threads, so `max_concurrency` is capped at `_ADS_MAX_THREADS`.
+    All ADS calls go through `call`, which reads the rate-limit headers,
+    adapts the number of calls in flight to the remaining quota, and retries
+    transient failures (HTTP 429/5xx, connection errors) with jittered backoff.
+    Once `max_requests` requests have been sent, further calls raise AdsUnavailableError,
+    as do all queries of an `offline` client.
+    """
+
+    def __init__(self, max_concurrency=1, max_requests=None, offline=False, disable_ssl=False):
+        self.max_concurrency = min(max(int(max_concurrency), 1), _ADS_MAX_THREADS)
+        self.max_requests = max_requests
+        self.offline = offline
+        self.disable_ssl = disable_ssl
+        self._adapter = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._executor = None
+        self._admitted = 0
+        self._waiters = []  # (loop, future) of the coroutines waiting to start an ADS call (see `acall`)
+
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._allowed = self.max_concurrency
+        self._in_flight = 0
+        self._paused_until = 0
+        self.requests = 0
+        self.requests_by_kind = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.quota = {}
+        self._quota_start = None
+
+    def session(self, kind="search"):
+        if self.offline:
+            raise AdsUnavailableError("ADS is not used in offline mode")
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.max_concurrency
+                )
+            if kind not in self._sessions:
+                # let ads build the session so that the token and headers stay in sync with ads
+                session = ads.base.BaseQuery().session
+                if kind == "search":
+                    session.headers.pop("Content-Type", None)
+                if self.disable_ssl:
+                    session.verify = False
+                session.mount("https://", self._adapter)
+                session.mount("http://", self._adapter)
+                session.hooks["response"].append(self._on_response)
+                self._sessions[kind] = session
+            return self._sessions[kind]
+
+    def _on_response(self, response, *args, **kwargs):
+        self._local.status = response.status_code
+        quota = {}
+        for name in ("limit", "remaining", "reset"):
+            try:
+                quota[name] = int(response.headers["x-ratelimit-{}".format(name)])
+            except (KeyError, ValueError):
+                pass
+        kind = _request_kind(response.request)
+        sent = len(response.request.body or b"")
+        received = len(response.content)
+        with self._cond:
+            self.requests += 1
+            self.requests_by_kind[kind] += 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+            # responses may arrive out of order; keep the lowest remaining quota of the current window
+            if "remaining" in quota and (
+                quota.get("reset") != self.quota.get("reset")
+                or "remaining" not in self.quota
+                or quota["remaining"] < self.quota["remaining"]
+            ):
+                self.quota = quota
+            if "remaining" in quota:
+                self._quota_start = max(self._quota_start or 0, quota["remaining"] + 1)
+            if response.status_code == 429:
+                self._allowed = max(self._allowed // 2, 1)
+            elif quota.get("limit") and quota.get("remaining", 0) * 20 < quota["limit"]:
+                self._allowed = 1  # less than 5% of the quota left; slow down
+            elif response.ok:
+                self._allowed = min(self._allowed + 1, self.max_concurrency)
+            self._cond.notify_all()
+            self._wake_waiters()
+        return response
+
+    def _seconds_to_reset(self):
+        reset = self.quota.get("reset")
+        return max(reset - time.time(), 0) if reset else None
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if self.max_requests is not None and self.requests + self._in_flight >= self.max_requests:
+                    raise AdsUnavailableError("ADS request budget (--max-requests) used up")
+                if self.quota.get("remaining") == 0:
+                    wait = self._seconds_to_reset()
+                    if wait is None or wait > _ADS_MAX_WAIT:
+                        raise AdsUnavailableError("ADS API rate limit exhausted")
+                    self._paused_until = max(self._paused_until, time.time() + wait)
+                now = time.time()
+                if self._in_flight < self._allowed and now >= self._paused_until:
+                    self._in_flight += 1
+                    return
+                self._cond.wait(max(self._paused_until - now, 0) or None)
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        for attempt in range(_ADS_RETRIES + 1):
+            self._local.status = None
+            self._acquire()
+            try:
+                return func(*args, **kwargs)
+            except (ads.exceptions.APIResponseError, requests.ConnectionError, requests.Timeout) as e:
+                status = self._local.status
+                if isinstance(e, ads.exceptions.APIResponseError) and status not in _ADS_TRANSIENT_STATUS:
+                    raise
+                error = e
+            finally:
+                self._release()
+
+            if status == 429:
+                wait = self._seconds_to_reset()
+                if self.quota.get("remaining") == 0 and (wait is None or wait > _ADS_MAX_WAIT):
+                    break
+            if attempt < _ADS_RETRIES:
+                with self._cond:
+                    self.retries += 1
+                delay = min(2**attempt, _ADS_MAX_WAIT) * random.uniform(0.5, 1.5)
+                with self._cond:
+                    self._paused_until = max(self._paused_until, time.time() + delay)
+                time.sleep(delay)
+        raise AdsUnavailableError(
+            "ADS API rate limit exhausted" if status == 429 else "ADS unavailable ({})".format(error)
+        )
+
+    def report(self):
+        msg = "ADS requests: {} ({} retries)".format(self.requests, self.retries)
+        if self.quota.get("remaining") is not None:
+            msg += "\nADS API quota used in this run: {}; remaining: {}/{}".format(
+                self._quota_start - self.quota["remaining"],
+                self.quota["remaining"],
+                self.quota.get("limit", "?"),
+            )
+            wait = self._seconds_to_reset()
+            if wait is not None:
+                msg += " (resets in {:.1f} hours)".format(wait / 3600.0)
+        return msg
+
+    def coalesce(self, memo_key, func, *args, **kwargs):
+        # run func once per memo_key during the current run (see `_MEMO`), so that a long-lived client
+        # does not keep results past the cache TTL; concurrent callers with the same memo_key wait for
+        # the same result. Outside a run, func is run on every call.
+        memo = _MEMO.get()
+        if memo is None:
+            return func(*args, **kwargs)
+        with self._lock:
+            future = memo.get(memo_key)
+            owner = future is None
+            if owner:
+                future = memo[memo_key] = futures.Future()
+        if owner:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+                with self._lock:
+                    del memo[memo_key]  # do not memoize failures
+        return future.result()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="adstex-ads"
+                )
+            return self._executor
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                t = threading.Thread(target=self._loop.run_forever, name="adstex-engine")
+                t.daemon = True
+                t.start()
+            return self._loop
+
+    def _wake_waiters(self):
+        # let the waiting coroutines check again whether they may start; called with self._cond held
+        for loop, waiter in self._waiters:
+            loop.call_soon_threadsafe(_resolve_waiter, waiter)
+        self._waiters = []
+
+    async def acall(self, func, *args):
+        # start the call only when the rate-limit window (see `_on_response`) has room for it, so that
+        # waiting calls do not hold a thread of the pool
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._admitted < self._allowed:
+                    self._admitted += 1
+                    break
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+        try:
+            return await loop.run_in_executor(self.executor, _bind_context(func), *args)
+        finally:
+            with self._cond:
+                self._admitted -= 1
+                self._wake_waiters()
+
+    async def amap(self, func, items):
+        return await asyncio.gather(*(self.acall(func, item) for item in items))
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, func, *args):
+        return asyncio.run_coroutine_threadsafe(self.acall(_bind_context(func), *args), self.loop)
+
+    def map(self, func, items):
+        items = list(items)
+        if self.max_concurrency <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        return self.run(self.amap(_bind_context(func), items))
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def _resolve_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _bind_context(func):
+    # run `func` in the context of the caller (and so with its config), e.g., in the threads of the ADS client
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(func, *args)
+
+
+def _get_client():
+    return _config().client
+
+
+class Config(object):
+    """
+    Settings and shared resources of adstex: the options of the ADS searches and of the
+    resolution of keys (see `_resolve_key` and `rank_candidates`), the ADS client, the optional cache and
+    snapshot, and the number of processes for parsing large inputs. The functions of
+    this module use the config of the current context (see `Resolver`), so that jobs
+    with different configs can run concurrently in one process.
+    """
+
+    def __init__(
+        self,
+        include_physics=False,
+        use_coauthors=False,
+        update=True,
+        merge_other=False,
+        force_regenerate=False,
+        auto_threshold=None,
+        client=None,
+        cache=None,
+        snapshot=None,
+        workers=1,
+    ):
+        self.database = '("astronomy" OR "physics")' if include_physics else "astronomy"
+        self.use_coauthors = use_coauthors
+        self.update = update
+        self.merge_other = merge_other
+        self.force_regenerate = force_regenerate
+        self.auto_threshold = auto_threshold
+        self.client = client if client is not None else AdsClient()
+        self.cache = cache
+        self.snapshot = snapshot
+        self.workers = workers
+
+    def close(self):
+        self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+
+def _config():
+    config = _CONFIG.get()
+    if config is None:
+        global _DEFAULT_CONFIG
+        if _DEFAULT_CONFIG is None:
+            _DEFAULT_CONFIG = Config()
+        config = _DEFAULT_CONFIG
+    return config
 
 
 def fixedAdsSearchQuery(*args, **kwargs):
+    client = _get_client()
     q = ads.SearchQuery(*args, **kwargs)
-    q.session.headers.pop("Content-Type", None)
-    if _DISABLE_SSL:
-        q.session.verify = False
+    q._session = client.session("search")
+    q.execute = partial(client.call, q.execute)
     return q
 
 
 def fixedAdsExportQuery(*args, **kwargs):
+    client = _get_client()
     q = ads.ExportQuery(*args, **kwargs)
-    if _DISABLE_SSL:
-        q.session.verify = False
+    q._session = client.session("export")
+    q.execute = partial(client.call, q.execute)
     return q
 
 
@@ -106,7 +713,7 @@ def _y2toy4(y2):
 
 def _split_authors(fa):
     fa = fa.strip(':').split(':')
-    if _USE_COAUTHORS and len(fa) > 1:
+    if _config().use_coauthors and len(fa) > 1:
         return fa[0], fa[1:]
     return fa[0], None
 
@@ -123,28 +730,220 @@ def _headerize(msg, extraline=True):
     return "{2}{0}\n{1}\n{0}".format("-" * 60, msg, "\n" if extraline else "")
 
 
-def search_keys(files, find_bib=False):
+class _TexBrackets(object):
+    # matching "[" -> "]" (nested) and "<" -> ">" within paragraphs, found in one pass over the text,
+    # so that unclosed optional arguments do not make scanning quadratic
+    def __init__(self, text):
+        self.close = {}
+        self.angles = []
+        self.blank_lines = []
+        stack = []
+        for m in _re_tex_bracket.finditer(text):
+            c = m.group()
+            if c == "[":
+                stack.append(m.start())
+            elif c == "]":
+                if stack:
+                    self.close[stack.pop()] = m.end()
+            elif c == ">":
+                self.angles.append(m.start())
+            elif c == "\n\n":
+                self.blank_lines.append(m.start())
+                stack = []
+
+    def skip(self, text, pos):
+        # text[pos] is "[" or "<"; returns the position after the matching "]" or ">",
+        # or None if a blank line or the end of text comes first
+        if text[pos] == "[":
+            return self.close.get(pos)
+        i = bisect.bisect_right(self.angles, pos)
+        if i == len(self.angles):
+            return
+        j = bisect.bisect_right(self.blank_lines, pos)
+        if j < len(self.blank_lines) and self.blank_lines[j] < self.angles[i]:
+            return
+        return self.angles[i] + 1
+
+
+def _parse_tex_args(text, pos, n_args=1, star=True, brackets=None):
+    # parse `[*] [optional args] {arg} ...` after a command; returns (args, end) or (None, pos)
+    start = pos
+    if star and text.startswith("*", pos):
+        pos += 1
+    pos = _re_tex_space.match(text, pos).end()
+    while brackets is not None and text[pos : pos + 1] in ("[", "<") and pos < len(text):
+        pos = brackets().skip(text, pos)
+        if pos is None:
+            return None, start
+        pos = _re_tex_space.match(text, pos).end()
+    args = []
+    for i in range(n_args):
+        if i:
+            pos = _re_tex_space.match(text, pos).end()
+        m = _re_tex_group.match(text, pos)
+        if not m:
+            return None, start
+        args.append(_re_tex_comment.sub("", m.group(1)))
+        pos = m.end()
+    return args, pos
+
+
+def _scan_tex(text):
+    keys = []
+    bib = None
+    includes = []
+    brackets = []
+
+    def get_brackets():
+        if not brackets:
+            brackets.append(_TexBrackets(text))
+        return brackets[0]
+
+    pos = 0
+    while True:
+        m = _re_tex_token.search(text, pos)
+        if not m:
+            break
+        pos = m.end()
+        name, simple_keys = m.groups()
+        if not name:  # comment or escaped "%"
+            continue
+        if name == "bibentry" or name[1:].startswith("ite"):
+            if simple_keys:
+                keys.extend(k.strip() for k in simple_keys.split(",") if k.strip())
+                continue
+            args, pos = _parse_tex_args(text, pos, brackets=get_brackets)
+            if args:
+                keys.extend(k.strip() for k in args[0].split(",") if k.strip())
+        elif simple_keys:  # not a citation command; parse it again below
+            pos = m.end(1)
+        if name.endswith("bibliography"):
+            args, pos = _parse_tex_args(text, pos)
+            if args and bib is None:
+                bib = [b.strip() for b in args[0].split(",")]
+        elif name.endswith("import"):
+            args, pos = _parse_tex_args(text, pos, n_args=2)
+            if args:
+                includes.append(os.path.join(args[0].strip(), args[1].strip()))
+        elif name.startswith("in") or name == "subfile":
+            args, pos = _parse_tex_args(text, pos, star=False)
+            if args:
+                includes.append(args[0].strip())
+    return {"keys": keys, "bib": bib, "includes": includes}
+
+
+def _process_map(func, items, size=0):
+    # map `func` over `items` in a pool of `Config.workers` processes if `size` (bytes to parse) makes it
+    # worth the start-up cost, else in this process; results are in the order of `items`.
+    # The processes are spawned, not forked, as this process may already run threads (e.g., the version check).
+    items = list(items)
+    workers = min(_config().workers, len(items))
+    if workers <= 1 or size < _PARALLEL_MIN_BYTES:
+        return [func(item) for item in items]
+    with futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(func, items))
+
+
+def _read_and_scan_tex(args):
+    # returns the hash of the file and its scan, or None as the scan if the hash is `known_hash`
+    path, known_hash = args
+    with open(path, "rb") as fp:
+        data = fp.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if digest == known_hash:
+        return digest, None
+    return digest, _scan_tex(data.decode("utf-8", errors="replace"))
+
+
+def scan_tex_files(paths):
+    # the per-file index (mtime, size, hash -> scan result) lets unchanged files be skipped;
+    # the other files are scanned, in the process pool if they are large enough
+    paths = [os.path.realpath(path) for path in paths]
+    stats = [os.stat(path) for path in paths]
+    indices = _cache_get_many("tex", paths)
+    scans = {}
+    pending = []
+    for path, st in zip(paths, stats):
+        index = indices.get(path)
+        if index and index["mtime"] == st.st_mtime_ns and index["size"] == st.st_size:
+            scans[path] = index["scan"]
+        elif path not in scans:
+            scans[path] = None
+            pending.append((path, st))
+
+    size = sum(st.st_size for _, st in pending)
+    results = _process_map(_read_and_scan_tex, [(path, (indices.get(path) or {}).get("hash")) for path, _ in pending], size)
+    items = []
+    for (path, st), (digest, scan) in zip(pending, results):
+        if scan is None:
+            scan = indices[path]["scan"]
+        scans[path] = scan
+        items.append((path, {"mtime": st.st_mtime_ns, "size": st.st_size, "hash": digest, "scan": scan}))
+    _cache_set_many("tex", items)
+    return [scans[path] for path in paths]
+
+
+def scan_tex_file(path):
+    return scan_tex_files([path])[0]
+
+
+def _find_included_file(name, dirpaths):
+    for dirpath in dirpaths:
+        path = os.path.join(dirpath, name)
+        for candidate in (path + ".tex", path):
+            if os.path.isfile(candidate):
+                return candidate
+
+
+def search_keys(files, find_bib=False, visited=None):
+    # if a set is passed as `visited`, the real paths of all scanned files are added to it
     if _is_like_string(files):
         files = [files]
     bib = None
     keys = set()
+    if visited is None:
+        visited = set()
+
+    # scan all reachable files first, one level of includes at a time, so that
+    # the files of each level can be scanned together (see scan_tex_files)
+    scans = {}
+    seen = set()
+    level = [(f, os.path.dirname(f)) for f in files]
+    while level:
+        todo = list(OrderedDict.fromkeys(os.path.realpath(f) for f, _ in level if os.path.realpath(f) not in scans))
+        scans.update(zip(todo, scan_tex_files(todo)))
+        next_level = []
+        for f, rootdir in level:
+            if (os.path.realpath(f), rootdir) in seen:
+                continue
+            seen.add((os.path.realpath(f), rootdir))
+            for name in scans[os.path.realpath(f)]["includes"]:
+                path = _find_included_file(name, (rootdir, os.path.dirname(f)))
+                if path:
+                    next_level.append((path, rootdir))
+        level = next_level
+
+    def visit(f, rootdir):
+        realpath = os.path.realpath(f)
+        if realpath in visited:  # also breaks include cycles
+            return
+        visited.add(realpath)
+        scan = scans[realpath]
+        nonlocal bib
+        if find_bib and not bib and scan["bib"]:
+            bib = []
+            for b in scan["bib"]:
+                if not b.lower().endswith(".bib"):
+                    b += ".bib"
+                bib.append(os.path.join(rootdir, b))
+        keys.update(scan["keys"])
+        for name in scan["includes"]:
+            path = _find_included_file(name, (rootdir, os.path.dirname(f)))
+            if path:
+                visit(path, rootdir)
+
     for f in files:
-        with open(f) as fp:
-            text = fp.read()
-        text = _re_comment.sub("", text)
-        if find_bib and not bib:
-            m = _re_bib.search(text)
-            if m:
-                dirpath = os.path.dirname(f)
-                bib = []
-                for b in m.groups()[0].split(","):
-                    b = b.strip()
-                    if not b.lower().endswith(".bib"):
-                        b += ".bib"
-                    bib.append(os.path.join(dirpath, b))
-        for m in _re_cite.finditer(text):
-            for k in m.groups()[0].split(","):
-                keys.add(k.strip())
+        visit(f, os.path.dirname(f))
     return keys, bib
 
 
@@ -162,46 +961,189 @@ def format_author(authors, max_char):
 
 def format_ads_entry(i, entry, max_char=78):
     title = entry.title[0][: max_char - 4] if entry.title else "<no title>"
-    return u"[{}] {} (cited {} times)\n    {}\n    {}".format(
+    return u"[{}] {} ({})\n    {}\n    {}".format(
         i,
         entry.bibcode,
-        entry.citation_count,
+        "from snapshot" if entry.citation_count is None else "cited {} times".format(entry.citation_count),
         format_author(entry.author, max_char - 4),
         title,
     )
 
 
-def id2bibcode(id_this, possible_id_types=("bibcode", "doi", "arxiv")):
+def _id_candidates(id_this, possible_id_types=("bibcode", "doi", "arxiv")):
     if _is_like_string(possible_id_types):
         possible_id_types = [possible_id_types]
+    ids = []
     for id_type in possible_id_types:
         m = _re_id[id_type].search(id_this)
-        if m:
-            s = fixedAdsSearchQuery(q="identifier:\"{}\"".format(m.group()), fl=["bibcode"])
-            try:
-                return next(s).bibcode
-            except (StopIteration, ads.exceptions.APIResponseError):
-                pass
+        if m and m.group() not in ids:
+            ids.append(m.group())
+    return ids
 
 
-def authoryear2bibcode(author, year, key, coauthors=None):
-    coauthors = ' '.join([f'author:"{_a}"' for _a in coauthors]) if coauthors else ""
-    q = 'first_author:"{}" {} year:{} database:{}'.format(author, coauthors, year, _DATABASE)
-    entries = list(
-        fixedAdsSearchQuery(
-            q=q,
-            fl=["id", "author", "bibcode", "title", "citation_count"],
-            sort="citation_count desc",
-            rows=20,
-            max_pages=0,
+def _normalize_id(id_this):
+    id_this = id_this.strip().lower()
+    for prefix in ("arxiv:", "doi:"):
+        if id_this.startswith(prefix):
+            return id_this[len(prefix) :]
+    return id_this
+
+
+def id2bibcode(id_this, possible_id_types=("bibcode", "doi", "arxiv")):
+    for id_candidate in _id_candidates(id_this, possible_id_types):
+        cached = _local_id2bibcodes([id_candidate])
+        if cached:
+            return cached[id_candidate]
+        s = fixedAdsSearchQuery(q="identifier:\"{}\"".format(id_candidate), fl=["bibcode"])
+        try:
+            bibcode = next(s).bibcode
+        except (StopIteration, ads.exceptions.APIResponseError):
+            pass
+        else:
+            _cache_set_many("id", [(id_candidate, bibcode)])
+            return bibcode
+
+
+def _resolve_id_chunk(ids):
+    wanted = {_normalize_id(id_this): id_this for id_this in ids}
+    q = "identifier:({})".format(" OR ".join("\"{}\"".format(id_this) for id_this in ids))
+    try:
+        records = list(
+            fixedAdsSearchQuery(
+                q=q,
+                fl=["bibcode", "identifier"],
+                rows=min(2 * len(ids), 2000),
+                max_pages=1,
+            )
         )
+    except ads.exceptions.APIResponseError:
+        # one malformed identifier should not sink the whole chunk
+        records = None
+    except AdsUnavailableError:
+        return {}, list(ids)
+
+    resolved = {}
+    failed = []
+    unmatched_record = False
+    for record in records or []:
+        fields = dict(record.items())
+        matched = False
+        for identifier in [fields.get("bibcode", "")] + list(fields.get("identifier") or []):
+            id_this = wanted.get(_normalize_id(identifier))
+            if id_this and id_this not in resolved:
+                resolved[id_this] = fields["bibcode"]
+                matched = True
+        unmatched_record = unmatched_record or not matched
+
+    # fall back to one query per identifier when the batch could not be mapped back
+    if records is None or unmatched_record:
+        for id_this in ids:
+            if id_this not in resolved:
+                try:
+                    bibcode = id2bibcode(id_this, ("bibcode", "doi", "arxiv"))
+                except AdsUnavailableError:
+                    failed.append(id_this)
+                    continue
+                if bibcode:
+                    resolved[id_this] = bibcode
+    return resolved, failed
+
+
+def ids2bibcodes(ids, chunk_size=_ID_CHUNK_SIZE):
+    ids = list(OrderedDict.fromkeys(ids))
+    resolved = _local_id2bibcodes(ids)
+    ids = [id_this for id_this in ids if id_this not in resolved]
+    chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    results = _get_client().map(_resolve_id_chunk, chunks)
+    failed = []
+    for result, failed_this in results:
+        resolved.update(result)
+        failed.extend(failed_this)
+        _cache_set_many("id", result.items())
+    return resolved, failed
+
+
+def batch_id2bibcode(ids_by_key):
+    # ids_by_key: key -> ordered candidate identifiers; the first one ADS resolves wins.
+    # Keys that could not be looked up because ADS was unavailable are returned separately.
+    resolved_ids, failed_ids = ids2bibcodes(
+        id_this for ids in ids_by_key.values() for id_this in ids
     )
+    failed_ids = set(failed_ids)
+    resolved = {}
+    failed = set()
+    for key, ids in ids_by_key.items():
+        for id_this in ids:
+            if id_this in resolved_ids:
+                resolved[key] = resolved_ids[id_this]
+                break
+        else:
+            if failed_ids.intersection(ids):
+                failed.add(key)
+    return resolved, failed
+
+
+def _authoryear_memo_key(author, year, coauthors=None):
+    normalize = lambda name: " ".join(name.lower().split())  # noqa: E731
+    return (
+        "authoryear",
+        normalize(author),
+        tuple(sorted(normalize(a) for a in coauthors or ())),
+        str(year),
+        _config().database,
+    )
+
+
+def search_authoryear(author, year, coauthors=None):
+    # identical (author, coauthors, year, database) searches run only once per run
+    return _get_client().coalesce(
+        _authoryear_memo_key(author, year, coauthors), _search_authoryear, author, year, coauthors
+    )
+
+
+def _authoryear_query(author, year, coauthors=None):
+    coauthors = ' '.join([f'author:"{_a}"' for _a in coauthors]) if coauthors else ""
+    return 'first_author:"{}" {} year:{} database:{}'.format(author, coauthors, year, _config().database)
+
+
+def _search_authoryear(author, year, coauthors=None):
+    snapshot = _config().snapshot
+    if snapshot is not None:
+        entries = snapshot.search_authoryear(author, year, coauthors)
+        if entries:
+            return entries
+    q = _authoryear_query(author, year, coauthors)
+    cached = _cache_get_many("authoryear", [q])
+    if q in cached:
+        entries = [_Candidate(*e) for e in cached[q]]
+    else:
+        entries = [
+            _Candidate(e.bibcode, e.author, e.title, e.citation_count)
+            for e in fixedAdsSearchQuery(
+                q=q,
+                fl=["id", "author", "bibcode", "title", "citation_count"],
+                sort="citation_count desc",
+                rows=20,
+                max_pages=0,
+            )
+        ]
+        _cache_set_many("authoryear", [(q, entries)])
+    if not entries and " " not in author:
+        new_author = _match_name_prefix(author)
+        if new_author:
+            return search_authoryear(new_author, year)
+    return entries
+
+
+def authoryear2bibcode(author, year, key, coauthors=None, entries=None, ranked=False):
+    if entries is None:
+        entries = search_authoryear(author, year, coauthors=coauthors)
     if entries:
         total = len(entries)
         print(
             _headerize(
-                "Choose one entry from below for <{}> (most cited at the end)".format(
-                    key
+                "Choose one entry from below for <{}> ({} at the end)".format(
+                    key, "best match" if ranked else "most cited"
                 )
             )
         )
@@ -232,20 +1174,45 @@ def authoryear2bibcode(author, year, key, coauthors=None):
         if not c:
             return
         return entries[c - 1].bibcode
-    elif " " not in author:
-        new_author = _match_name_prefix(author)
-        if new_author:
-            return authoryear2bibcode(new_author, year, key)
 
 
-def find_bibcode_interactive(key):
+def key2authoryear(key):
     m = _re_fayear.match(key)
     if m:
         fa, y = m.groups()
         fa, ca = _split_authors(fa)
         if len(y) == 2:
             y = _y2toy4(y)
-        bibcode = authoryear2bibcode(fa, y, key, coauthors=ca)
+        return fa, y, ca
+
+
+def prefetch_authoryear(keys):
+    # start the author+year searches in the background; returns key -> future of candidates.
+    # The searches run up to `max_concurrency` of the ADS client at a time (one at a time without --parallel)
+    client = _get_client()
+    prefetched = {}
+    submitted = {}
+    for key in keys:
+        authoryear = key2authoryear(key)
+        if authoryear:
+            fa, y, ca = authoryear
+            memo_key = _authoryear_memo_key(fa, y, ca)
+            if memo_key not in submitted:
+                submitted[memo_key] = client.submit(partial(search_authoryear, coauthors=ca), fa, y)
+            prefetched[key] = submitted[memo_key]
+    return prefetched
+
+
+def find_bibcode_interactive(key, prefetched=None, ranked=None):
+    # `ranked`: the candidates of `key` in the order of `rank_candidates`, if ranked
+    authoryear = key2authoryear(key)
+    if authoryear:
+        fa, y, ca = authoryear
+        if ranked is not None:
+            entries = ranked
+        else:
+            entries = prefetched.result() if prefetched is not None else None
+        bibcode = authoryear2bibcode(fa, y, key, coauthors=ca, entries=entries, ranked=ranked is not None)
         if bibcode:
             return bibcode
 
@@ -258,26 +1225,607 @@ def find_bibcode_interactive(key):
             return bibcode
 
 
+def _key_hints(key):
+    # the coauthors named in an author+year key ("Mao:Geha:2021") and its suffix letter ("Smith2019b")
+    m = _re_fayear.match(key)
+    if not m:
+        return [], ""
+    suffix = key[m.end() :]
+    return m.group(1).strip(":").split(":")[1:], suffix if re.match(r"[A-Za-z]$", suffix) else ""
+
+
+def _content_words(text):
+    return set(w for w in re.findall(r"[a-z]{4,}", text.lower()) if w not in _stopwords)
+
+
+def cite_contexts(paths, keys, width=_CONTEXT_WIDTH):
+    # key -> the content words of the TeX text around the citations of `key` in the files at `paths`
+    keys = set(keys)
+    contexts = defaultdict(set)
+    for path in paths:
+        with open(path, errors="replace") as fp:
+            text = fp.read()
+        text = _re_tex_comment.sub("", text)
+        for m in _re_cite_keys.finditer(text):
+            cited = keys.intersection(k.strip() for k in m.group(1).split(","))
+            if cited:
+                around = text[max(m.start() - width, 0) : m.start()] + " " + text[m.end() : m.end() + width]
+                words = _content_words(_re_tex_command.sub(" ", _re_cite_keys.sub(" ", around)))
+                for key in cited:
+                    contexts[key].update(words)
+    return contexts
+
+
+def rank_candidates(key, candidates, context=(), other=(), taken=()):
+    """
+    Rank the author+year `candidates` of `key`, best match first. Each candidate is scored on
+    its citation count (unless the key has a suffix letter, as in "Smith2019b", which
+    citations cannot tell apart), the coauthors named in the key, the words of its title
+    found in the TeX text around the citations of the key (`context`), and whether its
+    bibcode is in the other bib files (`other`) or already cited with another key (`taken`).
+    Returns a list of (confidence, candidate), where the confidences (softmax of the
+    scores) add up to 1.
+    """
+    if not candidates:
+        return []
+    coauthors, suffix = _key_hints(key)
+    coauthors = [_snapshot_name(name) for name in coauthors]
+    context = set(context)
+    max_citations = max(math.log1p(c.citation_count or 0) for c in candidates)
+    scores = []
+    for c in candidates:
+        score = 0.0
+        if max_citations and not suffix:
+            score += _RANK_WEIGHTS["citations"] * math.log1p(c.citation_count or 0) / max_citations
+        if coauthors:
+            names = set(_snapshot_name(_last_name(name)) for name in c.author or ())
+            score += _RANK_WEIGHTS["coauthors"] * sum(name in names for name in coauthors) / len(coauthors)
+        title_words = _content_words(" ".join(c.title or ()))
+        if title_words and context:
+            score += _RANK_WEIGHTS["title"] * len(title_words & context) / len(title_words)
+        if c.bibcode in other:
+            score += _RANK_WEIGHTS["other"]
+        if c.bibcode in taken:
+            score += _RANK_WEIGHTS["taken"]
+        scores.append(score)
+    top = max(scores)
+    weights = [math.exp(score - top) for score in scores]
+    total = sum(weights)
+    return sorted(((w / total, c) for w, c in zip(weights, candidates)), key=lambda t: -t[0])
+
+
+def rank_interactive(projects, keys, prefetched):
+    """
+    Rank the candidates of the author+year `keys`, as (project index, key), with the signals
+    of their projects (see `rank_candidates`); `prefetched` maps keys to futures of their candidates.
+    Keys are ranked in order, and the best match of each key counts as taken for the next
+    ones of its project, so that "Smith2019a" and "Smith2019b" are not matched to the same paper.
+    Returns (project index, key) -> list of (confidence, candidate) for the keys whose search succeeded.
+    """
+    contexts = {}
+    other = defaultdict(set)
+    taken = defaultdict(set)
+    for i, project in enumerate(projects):
+        cited = [key for j, key in keys if j == i]
+        if not cited:
+            continue
+        visited = set()
+        tex_files = [f for f in project.files if not f.lower().endswith(".bib")]
+        if tex_files:
+            search_keys(tex_files, visited=visited)
+        for key, words in cite_contexts(sorted(visited), cited).items():
+            contexts[(i, key)] = words
+        if isinstance(project.bib_other, LazyBibDatabase):
+            entries_other = project.bib_other.id_entries()
+        else:
+            entries_other = project.bib_other.entries
+        for entry in entries_other:
+            other[i].add(extract_bibcode(entry))
+        bibcodes_of = defaultdict(list)  # key -> the bibcodes of `all_entries` it names
+        for bibcode, keys_this in project.all_entries.items():
+            for key in keys_this:
+                bibcodes_of[key].append(bibcode)
+        for key in project.keys:
+            entry = project.bib.entries_dict.get(key)
+            bibcodes = [extract_bibcode(entry)] if entry is not None else []
+            bibcodes.extend(bibcodes_of.get(key, ()))
+            taken[i].update(b for b in bibcodes if b)
+
+    rankings = {}
+    for i, key in keys:
+        if key not in prefetched:
+            continue
+        try:
+            candidates = prefetched[key].result()
+        except AdsUnavailableError:
+            continue
+        ranking = rankings[(i, key)] = rank_candidates(key, candidates, contexts.get((i, key), ()), other[i], taken[i])
+        if ranking:
+            taken[i].add(ranking[0][1].bibcode)
+    return rankings
+
+
 def extract_bibcode(entry):
     m = _re_id["bibcode"].search(unquote(entry.get("adsurl", "")))
     if m:
         return m.group()
 
 
+def key2ids(key):
+    return _id_candidates(key)
+
+
+def entry2ids(entry):
+    ids = []
+    for field_name, possible_id_types in _entry_id_fields:
+        if field_name in entry:
+            for id_this in _id_candidates(unquote(entry[field_name]), possible_id_types):
+                if id_this not in ids:
+                    ids.append(id_this)
+    return ids
+
+
 def entry2bibcode(entry):
-    for field_name, possible_id_types in (
-        ("adsurl", "bibcode"),
-        ("doi", "doi"),
-        ("eprint", "arxiv"),
-        ("url", ("bibcode", "doi", "arxiv")),
-        ("pages", "arxiv"),
-    ):
+    for field_name, possible_id_types in _entry_id_fields:
         if field_name in entry:
             id_this = id2bibcode(unquote(entry[field_name]), possible_id_types)
             if id_this:
                 return id_this
 
 
+class BibIndex(object):
+    """
+    In-memory index of local bib entries by their identifiers (bibcode, DOI, arXiv ID),
+    as read by `entry2ids`, so that keys citing an entry that is already in a local bib
+    file can be resolved without asking ADS.
+    """
+
+    def __init__(self, entries=()):
+        self._index = defaultdict(list)
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        for id_this in entry2ids(entry):
+            entries = self._index[_normalize_id(id_this)]
+            if all(e["ID"] != entry["ID"] for e in entries):
+                entries.append(entry)
+
+    def find(self, ids):
+        # the first indexed entry that has any of `ids`, or None
+        for id_this in ids:
+            entries = self._index.get(_normalize_id(id_this))
+            if entries:
+                return entries[0]
+
+    @staticmethod
+    def duplicates(ids_by_key):
+        """
+        Groups of the cited keys of `ids_by_key` (key -> identifiers) that share an identifier.
+        The indexed entries are not counted, as uncited entries (e.g., of a shared read-only
+        library) need no change. Returns a list of (identifier, keys) with one item per
+        distinct group of keys.
+        """
+        groups = OrderedDict()
+        for key, ids in ids_by_key.items():
+            for id_this in ids:
+                keys = groups.setdefault(_normalize_id(id_this), [])
+                if key not in keys:
+                    keys.append(key)
+        duplicates = OrderedDict()
+        for id_this, keys in groups.items():
+            if len(keys) > 1:
+                duplicates.setdefault(tuple(sorted(keys)), id_this)
+        return [(id_this, list(keys)) for keys, id_this in duplicates.items()]
+
+
+def _bibcode_kind(bibcode):
+    # how likely the bibcode of an entry is to change: "arxiv", "in_press", "recent", "journal", or "unknown"
+    if not bibcode:
+        return "unknown"
+    if bibcode[4:9] in _eprint_journals:
+        return "arxiv"
+    if bibcode[9:13].strip(".") in ("tmp", "prep", "subm", "acc"):
+        return "in_press"
+    try:
+        year = int(bibcode[:4])
+    except ValueError:
+        return "unknown"
+    return "recent" if year >= date.today().year - 1 else "journal"
+
+
+def fresh_keys(entries_dict, keys=None):
+    """
+    The keys of existing entries that need no update check in this run: their bibcode
+    was checked (see `record_checked`) less than `_RECHECK_DAYS` ago for its kind.
+    """
+    bibcodes = {}
+    for key in entries_dict if keys is None else keys:
+        bibcode = extract_bibcode(entries_dict[key])
+        if bibcode and _RECHECK_DAYS[_bibcode_kind(bibcode)] > 0:
+            bibcodes[key] = bibcode
+    checked = _cache_get_many("checked", set(bibcodes.values()))
+    now = time.time()
+    return set(
+        key
+        for key, bibcode in bibcodes.items()
+        if bibcode in checked and now - checked[bibcode] < _RECHECK_DAYS[_bibcode_kind(bibcode)] * 86400.0
+    )
+
+
+def record_checked(bibcodes):
+    now = time.time()
+    _cache_set_many("checked", [(bibcode, now) for bibcode in set(bibcodes)])
+
+
+def _resolve_key(
+    key,
+    bib,
+    bib_other,
+    resolved,
+    failed,
+    update=True,
+    merge_other=False,
+    force_regenerate=False,
+    fresh=(),
+    deferred=(),
+):
+    """
+    Decide what to do with citation `key`, given the main and other bib databases,
+    the bibcodes found by the identifier lookups (`resolved`, key -> bibcode), the
+    keys whose lookups failed (`failed`), and the keys left out of the lookups as
+    recently checked (`fresh`) or over the request budget (`deferred`).
+    Has no side effects; returns a `_KeyResult` whose status is one of the keys of
+    `_key_status_messages`, or "interactive" if the key needs an author+year search.
+    """
+    key_exists = key in bib.entries_dict
+    key_exists_in_others = key in bib_other.entries_dict
+
+    bibcode_new = None
+    if update and (key_exists or (key_exists_in_others and merge_other)):
+        entry = bib.entries_dict[key] if key_exists else bib_other.entries_dict[key]
+        bibcode_new = resolved.get(key)
+        if bibcode_new and (bibcode_new != extract_bibcode(entry) or force_regenerate):
+            return _KeyResult(key, "update" if key_exists else "update_other", bibcode_new)
+
+    if key_exists:
+        if key in fresh:
+            return _KeyResult(key, "fresh", None)
+        if key in deferred:
+            return _KeyResult(key, "deferred", None)
+        return _KeyResult(key, "unchecked" if key in failed else "existing", bibcode_new)
+    if key_exists_in_others:
+        return _KeyResult(key, "merge" if merge_other else "ignore", bibcode_new)
+
+    bibcode = resolved.get(key)
+    if bibcode:
+        return _KeyResult(key, "new", bibcode)
+    if key in failed:
+        return _KeyResult(key, "unavailable", None)
+    return _KeyResult(key, "interactive", None)
+
+
+def _split_bibtex(text):
+    starts = [m for m in _re_bibtex_entry.finditer(text)]
+    ends = [m.start() for m in starts[1:]] + [len(text)]
+    return OrderedDict((m.group(1), text[m.start() : end].strip()) for m, end in zip(starts, ends))
+
+
+def _parse_bibtex_chunk(text, bibcodes):
+    try:
+        return bibtexparser.loads(text, parser=get_bparser()).entries
+    except Exception as e:  # bibtexparser may raise a variety of parsing errors
+        warnings.warn("Cannot parse the bibtex exported for {} ({})".format(", ".join(bibcodes), e))
+
+
+def _export_chunk(bibcodes, on_chunk=None):
+    # transient failures are retried by AdsClient.call
+    try:
+        text = fixedAdsExportQuery(bibcodes, "bibtex").execute()
+    except (ads.exceptions.APIResponseError, AdsUnavailableError, requests.RequestException) as e:
+        warnings.warn("Cannot export {} from ADS ({})".format(", ".join(bibcodes), e))
+        return
+    entries = _parse_bibtex_chunk(text, bibcodes)
+    if entries is not None:
+        texts = _split_bibtex(text)
+        _cache_set_many("bibtex", texts.items())
+        if on_chunk is not None:
+            on_chunk(texts)
+    return entries
+
+
+def _parse_known_bibtex(texts):
+    # the entries of the bibtex `texts` (bibcode -> bibtex, e.g., from the cache), parsed together,
+    # or one by one if any of them is corrupt; returns the entries and the set of bibcodes without an entry
+    try:
+        entries = bibtexparser.loads("\n\n".join(texts.values()), parser=get_bparser()).entries if texts else []
+    except Exception:  # bibtexparser may raise a variety of parsing errors
+        entries = []
+        for text in texts.values():
+            try:
+                entries.extend(bibtexparser.loads(text, parser=get_bparser()).entries)
+            except Exception:
+                pass
+    return entries, set(texts).difference(entry["ID"] for entry in entries)
+
+
+def export_bibtex(bibcodes, chunk_size=_EXPORT_CHUNK_SIZE, texts=None, on_chunk=None):
+    """
+    Export the bibtex of `bibcodes` from ADS in chunks (run concurrently by the ADS client).
+    Cached bibtex is used unless `Config.force_regenerate` is set (the exports are cached
+    either way); `texts` (bibcode -> bibtex) are used instead of exporting, and `on_chunk` is called
+    with the bibtex (bibcode -> bibtex) of each chunk as it is exported.
+    Returns a BibDatabase of all entries that were exported successfully
+    and the list of bibcodes that could not be exported.
+    """
+    bibcodes = list(bibcodes)
+    known = dict(texts or {})
+    snapshot = _config().snapshot
+    if snapshot is not None:
+        known.update(snapshot.bibtex(b for b in bibcodes if b not in known))
+    if _config().force_regenerate:  # the cached bibtex may be older than the latest version on ADS
+        texts = {}
+    else:
+        texts = _cache_get_many("bibtex", [b for b in bibcodes if b not in known])
+    texts.update((b, known[b]) for b in bibcodes if b in known)
+
+    bib_new = bibtexparser.loads(" ", parser=get_bparser())
+    entries, corrupt = _parse_known_bibtex(texts)
+    bib_new.entries.extend(entries)
+    # the bibcodes whose bibtex is not known or cannot be parsed are exported
+    missing = [b for b in bibcodes if b not in texts or b in corrupt]
+    chunks = [missing[i : i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    results = _get_client().map(partial(_export_chunk, on_chunk=on_chunk), chunks)
+
+    failed = []
+    for chunk, entries in zip(chunks, results):
+        if entries is None:
+            failed.extend(chunk)
+        else:
+            bib_new.entries.extend(entries)
+    return bib_new, failed
+
+
+def _bib_re(pattern, text):
+    # `pattern`, or its bytes version if `text` is bytes-like (e.g., a memory-mapped file)
+    if isinstance(text, str):
+        return pattern
+    if pattern not in _re_bytes:
+        _re_bytes[pattern] = re.compile(pattern.pattern.encode("ascii"), pattern.flags & ~re.UNICODE)
+    return _re_bytes[pattern]
+
+
+def _find_bib_close(text, pos, opening):
+    # end of the bibtex block opened by `opening` ("{" or "(") just before `pos`, or None
+    closing = "}" if _bibtex_delims[opening] == "{" else ")"
+    depth = 0
+    for d in _bib_re(_re_bibtex_delim, text).finditer(text, pos):
+        c = _bibtex_delims[d.group()]
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            if depth == 0 and closing == "}":
+                return d.end()
+            depth -= 1
+        elif c == ")" and depth == 0 and closing == ")":
+            return d.end()
+
+
+def _scan_bib_spans(text, strings=None):
+    # key -> (start, end) of each entry in `text` (a str, or bytes-like such as an mmap, whose keys are
+    # decoded as utf8); the last entry wins for duplicate keys.
+    # If a list is passed as `strings`, the (start, end) of each @string definition is appended to it.
+    is_str = isinstance(text, str)
+    re_block_start = _bib_re(_re_bibtex_block_start, text)
+    re_block_key = _bib_re(_re_bibtex_block_key, text)
+    re_next_line_block = _bib_re(_re_bibtex_next_line_block, text)
+    spans = {}
+    pos = 0
+    while pos < len(text):
+        m = re_block_start.match(text, pos)
+        kind = (m.group(1) if is_str else m.group(1).decode("ascii")).lower() if m else None
+        end = None
+        if m and kind != "comment":
+            end = _find_bib_close(text, m.end(), m.group(2))
+        if end is None:  # a comment (explicit, or any other text) runs up to the next "@" that starts a line
+            m = re_next_line_block.search(text, pos + 1)
+            pos = m.end() - 1 if m else len(text)
+            continue
+        start = m.end(0) - len(m.group(0).lstrip())
+        if kind == "string":
+            if strings is not None:
+                strings.append((start, end))
+        elif kind != "preamble":
+            k = re_block_key.match(text, m.end(), end)
+            if k:
+                spans[k.group(1) if is_str else k.group(1).decode("utf8", "replace")] = (start, end)
+        pos = end
+    return spans
+
+
+def _scan_bib_file(path):
+    # the (start, end, key) of the entries of a bib file, key -> identifier fields of the entries
+    # that have any, and its @string definitions; the file is scanned through a memory map, so
+    # that it is never read into memory as a whole
+    if not os.path.getsize(path):
+        return [], {}, ""
+    with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        strings = []
+        spans = sorted((start, end, key) for key, (start, end) in _scan_bib_spans(mm, strings).items())
+        starts = [span[0] for span in spans]
+        id_fields = {}
+        # one pass over the identifier fields of all entries
+        for m in _bib_re(_re_bibtex_id_field, mm).finditer(mm):
+            i = bisect.bisect_right(starts, m.start()) - 1
+            if i >= 0 and m.end() <= spans[i][1]:
+                fields = id_fields.setdefault(spans[i][2], {})
+                fields.setdefault(m.group(1).decode("ascii").lower(), m.group(2).decode("utf8", "replace"))
+        strings = b"\n".join(mm[start:end] for start, end in strings).decode("utf8", "replace")
+    return spans, id_fields, strings
+
+
+def _parse_bib_text(text):
+    return bibtexparser.loads(text, parser=get_bparser()).entries
+
+
+def load_bib(path):
+    """
+    Parse the bib file at `path` into a BibDatabase. A large file is split at entry
+    boundaries into chunks (each with the @string definitions that precede it), which
+    are parsed in the process pool; the entries keep the order of the file.
+    """
+    with open(path) as fp:
+        text = fp.read()
+    workers = _config().workers
+    n_chunks = 4 * workers
+    if workers <= 1 or len(text) < _PARALLEL_MIN_BYTES:
+        return bibtexparser.loads(text, parser=get_bparser())
+    strings = []
+    starts = sorted(start for start, _ in _scan_bib_spans(text, strings).values())
+    bounds = [0] + starts[len(starts) // n_chunks :: len(starts) // n_chunks or 1][: n_chunks - 1] + [len(text)]
+    chunks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        defined = OrderedDict()  # the last definition of each string wins, as in a full parse
+        for s, e in strings:
+            if e <= start:
+                m = _re_bibtex_block_start.match(text, s)
+                defined[text[m.end() : e].split("=", 1)[0].strip().lower()] = text[s:e]
+        chunks.append("\n".join(list(defined.values()) + [text[start:end]]))
+    bib = bibtexparser.bibdatabase.BibDatabase()
+    for entries in _process_map(_parse_bib_text, chunks, len(text)):
+        bib.entries.extend(entries)
+    return bib
+
+
+class LazyBibDatabase(object):
+    """
+    Read-only stand-in for the BibDatabase of large bib files (e.g., the --other bibs).
+    The files are scanned once for the keys, byte offsets and identifier fields of
+    their entries; an entry is only parsed (with the @string definitions of its file)
+    when it is accessed through `entries_dict`, so memory grows with the number of
+    entries used, not with the size of the files. Later files win for duplicate keys.
+    """
+
+    def __init__(self, paths=()):
+        self._spans = {}
+        self._strings = {}
+        self._parsed = {}
+        self._id_fields = {}
+        paths = list(paths)
+        scans = _process_map(_scan_bib_file, paths, sum(os.path.getsize(path) for path in paths))
+        for path, (spans, id_fields, strings) in zip(paths, scans):
+            for start, end, key in spans:
+                self._spans[key] = (path, start, end)
+                self._id_fields.pop(key, None)
+            self._id_fields.update(id_fields)
+            self._strings[path] = strings
+        self.entries_dict = _LazyEntriesDict(self)
+
+    def id_entries(self):
+        # the identifier fields of the entries that have any, enough for `entry2ids`, `extract_bibcode` and `BibIndex`
+        return (dict(fields, ID=key) for key, fields in self._id_fields.items())
+
+    def parse(self, keys):
+        # parse the entries of `keys` that have not been parsed yet, with one bibtexparser call per file
+        by_path = defaultdict(list)
+        for key in keys:
+            if key in self._spans and key not in self._parsed:
+                by_path[self._spans[key][0]].append(key)
+        for path, keys_this in by_path.items():
+            texts = [self._strings[path]]
+            with open(path, "rb") as fp:
+                for key in keys_this:
+                    start, end = self._spans[key][1:]
+                    fp.seek(start)
+                    texts.append(fp.read(end - start).decode("utf8", "replace"))
+            try:
+                entries = bibtexparser.loads("\n\n".join(texts), parser=get_bparser()).entries
+            except Exception as e:  # bibtexparser may raise a variety of parsing errors
+                warnings.warn("Cannot parse the entries {} in {} ({})".format(", ".join(keys_this), path, e))
+                entries = []
+            parsed = {entry["ID"]: entry for entry in entries}
+            for key in keys_this:
+                self._parsed[key] = parsed.get(key)
+
+    def get(self, key):
+        if key not in self._parsed:
+            self.parse([key])
+        return self._parsed.get(key)
+
+
+class _LazyEntriesDict(Mapping):
+    # key -> entry of a LazyBibDatabase; entries that cannot be parsed are left out
+    def __init__(self, db):
+        self._db = db
+
+    def __contains__(self, key):
+        return self._db.get(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._db.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __iter__(self):
+        return iter(self._db._spans)
+
+    def __len__(self):
+        return len(self._db._spans)
+
+
+def _dump_entry(entry):
+    db = bibtexparser.bibdatabase.BibDatabase()
+    db.entries = [entry]
+    return bibtexparser.dumps(db).strip()
+
+
+def write_bib(path, entries, backup=True):
+    """
+    Write new and updated `entries` to the bib file at `path`.
+    Updated entries replace the text of the existing entries with the same key,
+    new entries are appended, and the rest of the file is left untouched.
+    Returns True if the file has been (re)written.
+    """
+    try:
+        with open(path, "rb") as fp:
+            old_bytes = fp.read()
+    except IOError:
+        old_bytes = None
+    text = (old_bytes or b"").decode("utf8", errors="surrogateescape")
+
+    spans = _scan_bib_spans(text)
+    replacements = {}
+    appended = {}
+    for entry in entries:
+        if entry["ID"] in spans:
+            replacements[spans[entry["ID"]]] = _dump_entry(entry)
+        else:
+            appended[entry["ID"]] = _dump_entry(entry)
+
+    parts = []
+    pos = 0
+    for (start, end), entry_text in sorted(replacements.items()):
+        parts.append(text[pos:start])
+        parts.append(entry_text)
+        pos = end
+    parts.append(text[pos:])
+    if appended:
+        if text.strip():
+            parts.append("\n" if text.endswith("\n") else "\n\n")
+        parts.append("\n\n".join(appended[k] for k in sorted(appended)))
+        parts.append("\n")
+    new_bytes = "".join(parts).encode("utf8", errors="surrogateescape")
+
+    if new_bytes == old_bytes:
+        return False
+    if backup and old_bytes is not None:
+        copyfile(path, path + ".bak")
+    with open(path, "wb") as fp:
+        fp.write(new_bytes)
+    return True
+
+
 def update_bib(b1, b2):
     entries_dict = dict()
     for entry in b1.entries:
@@ -292,10 +1840,964 @@ def update_bib(b1, b2):
     return b1
 
 
-def main():
+def _snapshot_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _snapshot_name(name):
+    # "M{\"u}ller" -> "muller", "van den Bosch" -> "vandenbosch"; drops accent commands, keeps letters
+    return re.sub(r"[^a-z]", "", re.sub(r"\\(?:[a-zA-Z](?=[{\s])|[^a-zA-Z])", "", name).lower())
+
+
+def _split_bibtex_names(names):
+    # split a bibtex author list at " and " outside braces
+    depth = 0
+    start = 0
+    split = []
+    for m in re.finditer(r"[{}]|\s+and\s+", names):
+        if m.group() == "{":
+            depth += 1
+        elif m.group() == "}":
+            depth -= 1
+        elif not depth:
+            split.append(names[start : m.start()])
+            start = m.end()
+    split.append(names[start:])
+    return [name.strip() for name in split if name.strip()]
+
+
+def _last_name(name):
+    if "," in name:
+        return name.split(",", 1)[0]
+    return name.rsplit(None, 1)[-1] if name.strip() else name
+
+
+def _build_hash_table(items, postings):
+    # open-addressing table of key -> record indices; the indices are appended to `postings`
+    n_slots = 1 << (2 * len(items)).bit_length()
+    slots = [(0, 0, 0)] * n_slots
+    for key, indices in items.items():
+        h = _snapshot_hash(key)
+        i = h & (n_slots - 1)
+        while slots[i][2]:
+            i = (i + 1) & (n_slots - 1)
+        slots[i] = (h, len(postings), len(indices))
+        postings.extend(indices)
+    return n_slots, b"".join(_SNAPSHOT_SLOT.pack(*slot) for slot in slots)
+
+
+def build_snapshot(path, bib_paths):
+    """
+    Build an ADS snapshot at `path` from bibtex files that carry ADS bibcodes (in the
+    `adsurl` field, or as the citation keys of a bibtex export from ADS), such as a bulk
+    export from ADS or the bib files of a group. Returns the number of records.
+    """
+    entries = {}
+    for bib_path in bib_paths:
+        for entry in load_bib(bib_path).entries:
+            bibcode = extract_bibcode(entry)
+            if not bibcode:
+                m = _re_id["bibcode"].match(entry["ID"])
+                bibcode = m and m.group() == entry["ID"] and entry["ID"]
+            if bibcode and bibcode not in entries:
+                entries[bibcode] = entry
+
+    bibcodes = sorted(entries)
+    ids = OrderedDict()
+    authoryears = OrderedDict()
+    blobs = []
+    for i, bibcode in enumerate(bibcodes):
+        entry = entries[bibcode]
+        blobs.append(_dump_entry(dict(entry, ID=bibcode)).encode("utf-8"))
+        for id_this in [bibcode] + entry2ids(entry):
+            indices = ids.setdefault(_normalize_id(id_this), [])
+            if i not in indices:
+                indices.append(i)
+        authors = _split_bibtex_names(entry.get("author", ""))
+        if authors and entry.get("year", "").strip().isdigit():
+            authoryears.setdefault("{}:{}".format(_snapshot_name(_last_name(authors[0])), entry["year"].strip()), []).append(i)
+
+    postings = []
+    n_id_slots, id_table = _build_hash_table(ids, postings)
+    n_ay_slots, ay_table = _build_hash_table(authoryears, postings)
+    offset = _SNAPSHOT_HEADER.size + _SNAPSHOT_RECORD.size * len(bibcodes)
+    records = []
+    for bibcode, blob in zip(bibcodes, blobs):
+        records.append(_SNAPSHOT_RECORD.pack(bibcode.encode("ascii"), offset, len(blob)))
+        offset += len(blob)
+    id_offset = offset
+    ay_offset = id_offset + len(id_table)
+    postings_offset = ay_offset + len(ay_table)
+    header = _SNAPSHOT_HEADER.pack(
+        _SNAPSHOT_MAGIC,
+        _SNAPSHOT_VERSION,
+        len(bibcodes),
+        n_id_slots,
+        n_ay_slots,
+        _SNAPSHOT_HEADER.size,
+        id_offset,
+        ay_offset,
+        postings_offset,
+    )
+    with open(path + ".tmp", "wb") as fp:
+        fp.write(header)
+        fp.writelines(records)
+        fp.writelines(blobs)
+        fp.write(id_table)
+        fp.write(ay_table)
+        fp.write(struct.pack("<{}I".format(len(postings)), *postings))
+    os.replace(path + ".tmp", path)
+    return len(bibcodes)
+
+
+class AdsSnapshot(object):
+    """
+    Read-only ADS snapshot built by `build_snapshot`, memory-mapped so that opening it
+    does not depend on its size. The file holds fixed-size records (19-character
+    bibcode, offset and length of its bibtex) sorted by bibcode, the bibtex blobs, and
+    two open-addressing hash tables (keyed by the 64-bit blake2b hash of the key) from
+    the normalized identifiers and the "firstauthor:year" of each record to its records.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = _SNAPSHOT_HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            header = (None, None)
+        if header[:2] != (_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION):
+            self._mm.close()
+            raise ValueError("{} is not an adstex snapshot (or was built by another version of adstex)".format(path))
+        _, _, self._n_records, n_id_slots, n_ay_slots, self._records, id_offset, ay_offset, self._postings = header
+        self._tables = {"id": (id_offset, n_id_slots), "authoryear": (ay_offset, n_ay_slots)}
+
+    def __len__(self):
+        return self._n_records
+
+    def _find(self, table, key):
+        offset, n_slots = self._tables[table]
+        h = _snapshot_hash(key)
+        i = h & (n_slots - 1)
+        while True:
+            h_this, start, count = _SNAPSHOT_SLOT.unpack_from(self._mm, offset + i * _SNAPSHOT_SLOT.size)
+            if not count:
+                return ()
+            if h_this == h:
+                return struct.unpack_from("<{}I".format(count), self._mm, self._postings + 4 * start)
+            i = (i + 1) & (n_slots - 1)
+
+    def _record(self, i):
+        bibcode, offset, length = _SNAPSHOT_RECORD.unpack_from(self._mm, self._records + i * _SNAPSHOT_RECORD.size)
+        return bibcode.decode("ascii"), offset, length
+
+    def _bibtex(self, i):
+        _, offset, length = self._record(i)
+        return self._mm[offset : offset + length].decode("utf-8")
+
+    def id2bibcode(self, id_this):
+        for i in self._find("id", _normalize_id(id_this)):
+            return self._record(i)[0]
+
+    def bibtex(self, bibcodes):
+        # bibcode -> bibtex, for the bibcodes in the snapshot
+        texts = {}
+        for bibcode in bibcodes:
+            for i in self._find("id", _normalize_id(bibcode)):
+                if self._record(i)[0] == bibcode:
+                    texts[bibcode] = self._bibtex(i)
+        return texts
+
+    def search_authoryear(self, author, year, coauthors=None):
+        indices = self._find("authoryear", "{}:{}".format(_snapshot_name(author), year))
+        if not indices:
+            return []
+        entries = bibtexparser.loads("\n\n".join(self._bibtex(i) for i in indices), parser=get_bparser()).entries
+        candidates = []
+        for entry in entries:
+            authors = [name.replace("{", "").replace("}", "") for name in _split_bibtex_names(entry.get("author", ""))]
+            names = set(_snapshot_name(_last_name(name)) for name in authors)
+            if all(_snapshot_name(name) in names for name in coauthors or ()):
+                title = entry.get("title", "").replace("{", "").replace("}", "")
+                candidates.append(_Candidate(entry["ID"], authors, [title] if title else [], None))
+        return candidates
+
+    def close(self):
+        self._mm.close()
+
+
+def _fetch_latest_version():
+    cached = _cache_get_many("version", ["adstex"])
+    if cached:
+        return cached["adstex"]
+    try:
+        latest_version = requests.get(
+            "https://pypi.python.org/pypi/adstex/json", timeout=2,
+        ).json()["info"]["version"]
+    except (requests.RequestException, KeyError, ValueError):
+        return
+    _cache_set_many("version", [("adstex", latest_version)])
+    return latest_version
+
+
+def _is_newer_version(version):
+    import packaging.version
+
+    try:
+        return packaging.version.parse(version) > packaging.version.parse(__version__)
+    except packaging.version.InvalidVersion:
+        return False
+
+
+def _start_version_check():
+    # check PyPI in a background thread; the result is cached for a day
+    future = futures.Future()
+
+    def run():
+        try:
+            future.set_result(_fetch_latest_version())
+        except Exception:  # never let the version check break a run
+            future.set_result(None)
+
+    # in the context of the caller, so that the result is cached in the cache of its config
+    t = threading.Thread(target=_bind_context(run), name="adstex-version-check")
+    t.daemon = True
+    t.start()
+    return future
+
+
+class _Project(object):
+    # the state of one (tex files, output bib) project during a run
+    def __init__(self, files, output, other=None, keys=None):
+        self.files = files
+        self.output = output
+        self.other = list(other or [])
+        self.keys = keys  # None: all keys in the output bib (bib update mode)
+        self.bib = None
+        self.bib_other = None
+        self.index = None
+        self.duplicates = []
+        self.fresh = set()
+        self.deferred = set()
+        self.results = []
+        self.interactive = []
+        self.not_found = []
+        self.unavailable = []
+        self.to_retrieve = set()
+        self.all_entries = defaultdict(list)
+        self.changed = []
+
+    def load(self):
+        if os.path.isfile(self.output):
+            self.bib = load_bib(self.output)
+        else:
+            self.bib = bibtexparser.loads(" ", parser=get_bparser())
+
+        self.bib_other = LazyBibDatabase(self.other)
+        self.bib_other.parse(self.keys if self.keys is not None else self.bib.entries_dict)
+        self.prepare()
+
+    def prepare(self):
+        # index the loaded bib databases, and find the cited keys that share an identifier
+        if self.keys is None:
+            self.keys = list(self.bib.entries_dict)
+        self.keys = sorted(self.keys)
+
+        self.index = BibIndex(self.bib.entries)
+        if isinstance(self.bib_other, LazyBibDatabase):
+            other_entries = self.bib_other.id_entries()
+        else:
+            other_entries = self.bib_other.entries
+        for entry in other_entries:
+            self.index.add(entry)
+        ids_by_key = OrderedDict()
+        for key in self.keys:
+            entry = self.bib.entries_dict.get(key) or self.bib_other.entries_dict.get(key)
+            ids_by_key[key] = entry2ids(entry) if entry else key2ids(key)
+        self.duplicates = self.index.duplicates(ids_by_key)
+
+    def lookups(self, update=True, merge_other=False):
+        # returns the identifiers to look up on ADS (key -> ids), and the new keys
+        # that cite an entry in a local bib file, resolved to its bibcode (key -> bibcode)
+        lookups = OrderedDict()
+        local = {}
+        new_keys = []
+        for key in self.keys:
+            if key in self.fresh or key in self.deferred:
+                continue
+            if update and key in self.bib.entries_dict:
+                lookups[key] = entry2ids(self.bib.entries_dict[key])
+            elif update and key in self.bib_other.entries_dict and merge_other:
+                lookups[key] = entry2ids(self.bib_other.entries_dict[key])
+            elif key not in self.bib.entries_dict and key not in self.bib_other.entries_dict:
+                new_keys.append(key)
+        for key in new_keys:
+            ids = key2ids(key)
+            entry = self.index.find(ids)
+            if entry is not None and entry["ID"] in lookups:
+                lookups[key] = lookups[entry["ID"]]  # shares the lookup of the local entry, which may update it
+            elif entry is not None and extract_bibcode(entry):
+                local[key] = extract_bibcode(entry)
+            else:
+                lookups[key] = ids
+        return lookups, local
+
+    def merge_results(self):
+        # merge the per-key results in a single pass, in key order
+        for result in self.results:
+            key = result.key
+            if result.bibcode:
+                self.all_entries[result.bibcode].append(key)
+            if result.status in ("update", "update_other", "new"):
+                self.to_retrieve.add(result.bibcode)
+            elif result.status == "merge":
+                self.bib.entries.append(self.bib_other.entries_dict[key])
+                self.changed.append(self.bib_other.entries_dict[key])
+            elif result.status == "unavailable":
+                self.unavailable.append(key)
+            elif result.status == "interactive":
+                self.interactive.append(key)
+                continue
+            print(_key_status_messages[result.status].format(**result._asdict()))
+
+    def report_duplicates(self):
+        if self.duplicates:
+            print(_headerize("The following keys refer to the same entry"))
+            for id_this, keys in self.duplicates:
+                print(
+                    "{1} is shared by the following keys; please keep only one:\n{0}\n".format(
+                        " ".join(keys), id_this
+                    )
+                )
+
+    def report(self):
+        if self.not_found:
+            print(_headerize("Please check the following keys"))
+            for key in self.not_found:
+                print(key)
+
+        if self.unavailable:
+            print(
+                _headerize(
+                    "ADS was unavailable (e.g., rate limit exhausted) for the following keys; please run adstex again later"
+                )
+            )
+            for key in self.unavailable:
+                print(key)
+
+        # skip the duplicates that were already reported from the local identifiers
+        reported = [set(keys) for _, keys in self.duplicates]
+        repeated_keys = [
+            t
+            for t in self.all_entries.items()
+            if len(t[1]) > 1 and not any(keys.issuperset(t[1]) for keys in reported)
+        ]
+        if repeated_keys:
+            print(_headerize("The following keys refer to the same entry"))
+            for b, k in repeated_keys:
+                print(
+                    "{1} has been referred as the following keys; please keep only one:\n{0}\n".format(
+                        " ".join(k), b
+                    )
+                )
+
+
+def _n_chunks(n, chunk_size):
+    return (n + chunk_size - 1) // chunk_size
+
+
+class RequestPlan(object):
+    """
+    The ADS requests that a run would send in each phase, worked out from the bib files
+    and the cache without any network call. The counts are estimates: a lookup that
+    is not cached is assumed to find a new (or changed) bibcode, and every key that needs
+    an author+year search is assumed to be answered; but the one-by-one identifier searches
+    that follow a batched search whose records cannot be mapped back (see `_resolve_id_chunk`)
+    and the lookups of identifiers typed at the prompts cannot be told in advance, and are not
+    counted. Requests for new keys and for the update check of existing entries ("refresh")
+    are counted separately, so that `defer_refreshes` can fit a run into a request budget.
+    """
+
+    def __init__(self, projects, lookups, local, update=True, merge_other=False, force_regenerate=False):
+        # lookups: (project index, key) -> ids, local: per project, key -> bibcode (see `_Project.lookups`)
+        cached_ids = _local_id2bibcodes(set(id_this for ids in lookups.values() for id_this in ids))
+        resolved = {}
+        new_ids = set()
+        self._refresh_ids = OrderedDict()
+        self._kinds = {}
+        for (i, key), ids in lookups.items():
+            uncached = set(id_this for id_this in ids if id_this not in cached_ids)
+            hits = [cached_ids[id_this] for id_this in ids if id_this in cached_ids]
+            if hits or uncached:
+                # a placeholder stands for the bibcode that the lookup of `ids` will find
+                resolved[(i, key)] = hits[0] if hits else "?" + " ".join(ids)
+            entry = projects[i].bib.entries_dict.get(key) or projects[i].bib_other.entries_dict.get(key)
+            if entry is None:
+                new_ids.update(uncached)
+            else:
+                self._refresh_ids[(i, key)] = uncached
+                self._kinds[(i, key)] = _bibcode_kind(extract_bibcode(entry))
+        for ids in self._refresh_ids.values():
+            ids.difference_update(new_ids)
+
+        new_exports = set()
+        refresh_exports = {}
+        interactive = set()
+        self.keys = Counter(new=0, refresh=len(self._refresh_ids), interactive=0)
+        for i, project in enumerate(projects):
+            resolved_this = dict(local[i])
+            resolved_this.update((key, bibcode) for (j, key), bibcode in resolved.items() if j == i)
+            for key in project.keys:
+                result = _resolve_key(
+                    key,
+                    project.bib,
+                    project.bib_other,
+                    resolved_this,
+                    (),
+                    update,
+                    merge_other,
+                    force_regenerate,
+                    project.fresh,
+                    project.deferred,
+                )
+                if result.status == "new":
+                    new_exports.add(result.bibcode)
+                    self.keys["new"] += 1
+                elif result.status in ("update", "update_other"):
+                    refresh_exports[(i, key)] = result.bibcode
+                elif result.status == "interactive":
+                    interactive.add((i, key))
+
+        # keys shared by several projects are searched once, but asked in each project; each answer is exported
+        snapshot = _config().snapshot
+        searches = {}
+        retries = {}  # query -> the search that follows if it finds nothing (see `_search_authoryear`)
+        for i, key in interactive:
+            authoryear = key2authoryear(key)
+            if authoryear and not (snapshot is not None and snapshot.search_authoryear(*authoryear)):
+                query = searches[_authoryear_memo_key(*authoryear)] = _authoryear_query(*authoryear)
+                author, year = authoryear[:2]
+                new_author = " " not in author and _match_name_prefix(author)
+                if new_author:
+                    retries[query] = _authoryear_query(new_author, year)
+            new_exports.add("?{}:{}".format(i, key))
+        cached = _cache_get_many("authoryear", list(searches.values()) + list(retries.values()))
+        searches = set(searches.values())
+        searches = set(q for q in searches if q not in cached).union(
+            retries[q] for q in searches if q in retries and not cached.get(q) and retries[q] not in cached
+        )
+        self.keys["interactive"] = len(interactive)
+
+        bibcodes = [b for b in set(new_exports).union(refresh_exports.values()) if not b.startswith("?")]
+        cached_bibtex = _cache_get_many("bibtex", bibcodes)
+        if snapshot is not None:
+            cached_bibtex.update(snapshot.bibtex(bibcodes))
+        new_exports.difference_update(cached_bibtex)
+        self._refresh_exports = dict(
+            (key, bibcode)
+            for key, bibcode in refresh_exports.items()
+            if bibcode not in cached_bibtex and bibcode not in new_exports
+        )
+        refresh_ids = set(id_this for ids in self._refresh_ids.values() for id_this in ids)
+        self.counts = OrderedDict(
+            [
+                (
+                    "resolve",
+                    Counter(new=_n_chunks(len(new_ids), _ID_CHUNK_SIZE), refresh=_n_chunks(len(refresh_ids), _ID_CHUNK_SIZE)),
+                ),
+                ("interactive", Counter(new=len(searches), refresh=0)),
+                (
+                    "export",
+                    Counter(
+                        new=_n_chunks(len(new_exports), _EXPORT_CHUNK_SIZE),
+                        refresh=_n_chunks(len(set(self._refresh_exports.values())), _EXPORT_CHUNK_SIZE),
+                    ),
+                ),
+            ]
+        )
+
+    @property
+    def refreshes(self):
+        # the lookups (project index, key) of existing entries
+        return set(self._refresh_ids)
+
+    @property
+    def total(self):
+        return sum(sum(counts.values()) for counts in self.counts.values())
+
+    def defer_refreshes(self, max_requests):
+        """
+        The refresh lookups to leave out of the run so that the requests of this plan fit in
+        `max_requests`. The requests for new keys come first; then the update checks of the
+        entries most likely to have changed (arXiv preprints, papers in press) are kept
+        as long as they fit.
+        """
+        remaining = max_requests - sum(counts["new"] for counts in self.counts.values())
+        ids = set()
+        exports = set()
+        deferred = set()
+        for key in sorted(self._refresh_ids, key=lambda k: _PLAN_PRIORITY.index(self._kinds[k])):
+            ids_this = ids.union(self._refresh_ids[key])
+            exports_this = exports.union([self._refresh_exports[key]] if key in self._refresh_exports else [])
+            if _n_chunks(len(ids_this), _ID_CHUNK_SIZE) + _n_chunks(len(exports_this), _EXPORT_CHUNK_SIZE) <= remaining:
+                ids, exports = ids_this, exports_this
+            else:
+                deferred.add(key)
+        return deferred
+
+    def format(self):
+        labels = {
+            "resolve": "identifier searches",
+            "interactive": "author+year searches",
+            "export": "bibtex exports",
+        }
+        lines = ["Planned ADS requests (an estimate; cached lookups are not counted):"]
+        for phase, counts in self.counts.items():
+            lines.append(
+                "{:<12} {:<22} {:>6}  (new keys: {}, refreshes: {})".format(
+                    phase, labels[phase], sum(counts.values()), counts["new"], counts["refresh"]
+                )
+            )
+        lines.append("{:<35} {:>6}".format("total", self.total))
+        lines.append(
+            "Not counted: one-by-one retries of identifier searches that ADS answers ambiguously, "
+            "and the identifiers you type at the prompts."
+        )
+        lines.append(
+            "Keys: {new} new with an identifier, {refresh} existing entries to check, "
+            "{interactive} to search by author+year".format(**self.keys)
+        )
+        return "\n".join(lines)
+
+
+ResolvedKey = namedtuple("ResolvedKey", ("key", "status", "bibcode", "entry", "candidates"))
+
+
+class Resolver(object):
+    """
+    Importable API to resolve citation keys to ADS bibtex entries, e.g., for build systems
+    and services that resolve many papers in one long-lived process. A resolver holds a
+    `Config`, whose ADS client (pooled sessions and rate limits) and cache are shared by
+    all jobs of the resolver; `resolve` can be called from several threads, and `aresolve`
+    from coroutines, at the same time. The ADS client keeps at most its `max_concurrency`
+    calls in flight across all jobs: the default config allows 8, and a config of your own
+    should have a client such as `AdsClient(max_concurrency=8)` to serve jobs concurrently.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else Config(client=AdsClient(max_concurrency=8))
+
+    def resolve(self, keys, bib=None, bib_other=None, answers=None):
+        """
+        Resolve citation `keys` given `bib`, the BibDatabase of the main bib file (its
+        entries are checked for updates if `config.update`), and `bib_other`, a BibDatabase
+        (or LazyBibDatabase) of read-only entries. Keys without identifiers are not asked
+        interactively: the best match is selected if its confidence is at least
+        `config.auto_threshold`, else they get the status "interactive" and their ranked
+        author+year candidates, and can be resolved in a later call with `answers`
+        (key -> identifier).
+        Returns a list of `ResolvedKey` in key order; the status is one of the keys of
+        `_key_status_messages`, "interactive", or "not_found". `entry` is the exported
+        bibtex entry (with the key as its ID) of new and updated keys (None if it could
+        not be exported), or the entry of `bib_other` for merged keys.
+        """
+        token = _CONFIG.set(self.config)
+        memo_token = _MEMO.set({})
+        try:
+            return self._resolve(keys, bib, bib_other, answers or {})
+        finally:
+            _MEMO.reset(memo_token)
+            _CONFIG.reset(token)
+
+    async def aresolve(self, keys, bib=None, bib_other=None, answers=None):
+        # the ADS calls of a job run in the threads of the ADS client; the job waits for them in a thread
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self.resolve, keys, bib, bib_other, answers))
+
+    def _resolve(self, keys, bib, bib_other, answers):
+        config = self.config
+        project = _Project((), None, keys=list(keys))
+        project.bib = bib if bib is not None else bibtexparser.loads(" ", parser=get_bparser())
+        project.bib_other = bib_other if bib_other is not None else bibtexparser.loads(" ", parser=get_bparser())
+        project.prepare()
+
+        lookups, local = project.lookups(config.update, config.merge_other)
+        resolved, failed = batch_id2bibcode(lookups)
+        resolved.update(local)
+        results = OrderedDict()
+        for key in project.keys:
+            result = _resolve_key(
+                key,
+                project.bib,
+                project.bib_other,
+                resolved,
+                failed,
+                config.update,
+                config.merge_other,
+                config.force_regenerate,
+            )
+            results[key] = ResolvedKey(result.key, result.status, result.bibcode, None, None)
+
+        project.interactive = [key for key, result in results.items() if result.status == "interactive"]
+        to_rank = [key for key in project.interactive if key not in answers]
+        prefetched = prefetch_authoryear(to_rank)
+        rankings = rank_interactive([project], [(0, key) for key in to_rank], prefetched)
+        rankings = {key: ranking for (_, key), ranking in rankings.items()}
+        for key in project.interactive:
+            try:
+                if key in answers:
+                    bibcode = id2bibcode(answers[key])
+                    results[key] = ResolvedKey(key, "new" if bibcode else "not_found", bibcode, None, None)
+                elif key in prefetched and key not in rankings:
+                    prefetched[key].result()  # the search failed; raises AdsUnavailableError
+                elif rankings.get(key) and config.auto_threshold is not None and rankings[key][0][0] >= config.auto_threshold:
+                    results[key] = ResolvedKey(key, "new", rankings[key][0][1].bibcode, None, None)
+                else:
+                    candidates = [c for _, c in rankings.get(key, [])]
+                    results[key] = ResolvedKey(key, "interactive" if candidates else "not_found", None, None, candidates)
+            except AdsUnavailableError:
+                results[key] = ResolvedKey(key, "unavailable", None, None, None)
+
+        to_retrieve = sorted(
+            set(r.bibcode for r in results.values() if r.status in ("update", "update_other", "new"))
+        )
+        exported = {}
+        if to_retrieve:
+            bib_new, _ = export_bibtex(to_retrieve)
+            exported = {entry["ID"]: entry for entry in bib_new.entries}
+        for key, result in results.items():
+            if result.status in ("update", "update_other", "new") and result.bibcode in exported:
+                results[key] = result._replace(entry=dict(exported[result.bibcode], ID=key))
+            elif result.status == "merge":
+                results[key] = result._replace(entry=project.bib_other.entries_dict[key])
+        return list(results.values())
+
+
+def _find_project_bibs(files):
+    # auto-identify the bib files from the tex source; returns keys, output bib, other bibs
+    keys, bib = search_keys(files, find_bib=True)
+    if not bib:
+        return keys, None, []
+    return keys, bib[0], bib[1:]
+
+
+def _load_manifest(path):
+    """
+    Load a batch manifest: a JSON list of projects, each an object with "tex"
+    (a tex file or a list of them), and optionally "output" (the main bib file;
+    identified from the tex source if missing) and "other" (a list of read-only
+    bib files). Relative paths are relative to the manifest.
+    """
+    with open(path) as fp:
+        manifest = json.load(fp)
+    dirpath = os.path.dirname(path)
+    projects = []
+    for item in manifest:
+        tex = item["tex"]
+        files = [os.path.join(dirpath, f) for f in ([tex] if _is_like_string(tex) else tex)]
+        other = [os.path.join(dirpath, f) for f in item.get("other") or []]
+        if item.get("output"):
+            keys, _ = search_keys(files)
+            output = os.path.join(dirpath, item["output"])
+        else:
+            keys, output, found = _find_project_bibs(files)
+            if output is None:
+                raise ValueError(
+                    "Cannot identify bibtex file from {}; set \"output\" in the manifest".format(", ".join(files))
+                )
+            other.extend(found)
+        projects.append(_Project(files, output, other, keys))
+    return projects
+
+
+def _journal_header(projects, args):
+    # identifies a run: an interrupted run can only be resumed with the same output files (and contents) and options
+    hashes = []
+    for project in projects:
+        try:
+            with open(project.output, "rb") as fp:
+                hashes.append(hashlib.sha1(fp.read()).hexdigest())
+        except IOError:
+            hashes.append(None)
+    return {
+        "version": __version__,
+        "outputs": [os.path.realpath(project.output) for project in projects],
+        "hashes": hashes,
+        "options": {
+            k: getattr(args, k)
+            for k in ("update", "force_regenerate", "merge_other", "include_physics", "use_coauthors")
+        },
+    }
+
+
+def _stat_files(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+def watch(files, output, bib, bib_other, keys, merge_other=False, backup=True, interval=1.0):
+    """
+    Poll the TeX `files` (and the files they include) every `interval` seconds, and
+    whenever they change, resolve the newly cited keys and add their entries to `output`.
+    `bib` and `bib_other` are the loaded bib databases, and `keys` the keys already handled.
+    Existing entries are not checked again, and keys without identifiers are reported
+    and skipped, as they need an interactive search. Runs until interrupted.
+    """
+    known = set(keys)
+    visited = set()
+    search_keys(files, visited=visited)
+    mtimes = _stat_files(visited | {output})
+
+    print(_headerize("Watching {} for new citations (press Ctrl+C to stop)...".format(", ".join(files))))
+    try:
+        while True:
+            time.sleep(interval)
+            current = _stat_files(visited | {output})
+            if current == mtimes:
+                continue
+
+            if current[output] != mtimes.get(output) and current[output] is not None:  # edited by someone else
+                bib = load_bib(output)
+
+            visited = set()
+            new_keys, _ = search_keys(files, visited=visited)
+            new_keys = sorted(new_keys - known)
+            lookups = OrderedDict(
+                (key, key2ids(key))
+                for key in new_keys
+                if key not in bib.entries_dict and key not in bib_other.entries_dict
+            )
+            resolved, failed = batch_id2bibcode(lookups)
+
+            to_retrieve = defaultdict(list)
+            changed = []
+            for key in new_keys:
+                result = _resolve_key(key, bib, bib_other, resolved, failed, update=False, merge_other=merge_other)
+                known.add(key)
+                if result.status == "new":
+                    to_retrieve[result.bibcode].append(key)
+                elif result.status == "merge":
+                    changed.append(bib_other.entries_dict[key])
+                elif result.status == "unavailable":
+                    known.discard(key)  # try again on the next change
+                elif result.status == "interactive":
+                    print("{}: NO IDENTIFIER, SKIPPED (run adstex without --watch to search ADS)".format(key))
+                    continue
+                print(_key_status_messages[result.status].format(**result._asdict()))
+
+            if to_retrieve:
+                bib_new, failed = export_bibtex(sorted(to_retrieve))
+                for entry in bib_new.entries:
+                    entry["ID"] = to_retrieve[entry["ID"]][0]
+                for b in failed:
+                    print("{}: COULD NOT BE RETRIEVED FROM ADS".format(", ".join(to_retrieve[b])))
+                    known.difference_update(to_retrieve[b])
+                changed.extend(bib_new.entries)
+            if changed:
+                bib_changed = bibtexparser.bibdatabase.BibDatabase()
+                bib_changed.entries = changed
+                bib = update_bib(bib, bib_changed)
+                if write_bib(output, changed, backup=backup):
+                    print("{} entries written to {}".format(len(changed), output))
+
+            # keep the times from before the scan, so that saves during this update are not missed
+            mtimes = {f: current[f] for f in visited | {output} if f in current}
+            mtimes.update(_stat_files(visited - set(mtimes)))
+            if changed:
+                mtimes.update(_stat_files([output]))
+    except KeyboardInterrupt:
+        print()
+
+
+class RunJournal(object):
+    """
+    Append-only JSON-lines journal of a run, which records the identifier lookups
+    and interactive answers of each key, and the bibtex of each export chunk, as
+    they complete. With `resume=True`, the records of an interrupted run with the
+    same `header` (outputs, their contents, and options) are loaded so that the run
+    can skip the work already done. The journal is removed when the run completes.
+    """
+
+    def __init__(self, path, header, resume=False):
+        self.path = path
+        self.lookups = {}
+        self.answers = {}
+        self.bibtex = {}
+        self._lock = threading.Lock()
+        self._partial = False
+        self.resumed = resume and self._load(header)
+        if resume and not self.resumed:
+            print("No journal of an interrupted run with the same files and options at {}; starting over.".format(path))
+        elif not resume and os.path.isfile(path):
+            print("Discarding the journal of an interrupted run at {} (use --resume to continue it).".format(path))
+        self._fp = open(path, "a" if self.resumed else "w")
+        if not self.resumed:
+            self._write([dict(header, type="run")])
+        elif self._partial:
+            self._fp.write("\n")  # end the partial last line, so that it does not swallow the next record
+
+    def _load(self, header):
+        try:
+            with open(self.path) as fp:
+                lines = fp.readlines()
+        except IOError:
+            return False
+        self._partial = bool(lines) and not lines[-1].endswith("\n")
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:  # a partial last line of an interrupted write
+                continue
+            if i == 0:
+                if dict(header, type="run") != record:
+                    return False
+            elif record["type"] == "lookup":
+                self.lookups[tuple(record["key"])] = record["bibcode"]
+            elif record["type"] == "answer":
+                self.answers[tuple(record["key"])] = record["bibcode"]
+            elif record["type"] == "export":
+                self.bibtex.update(record["bibtex"])
+        return bool(lines)
+
+    def _write(self, records):
+        with self._lock:
+            for record in records:
+                self._fp.write(json.dumps(record) + "\n")
+            self._fp.flush()
+
+    def record_lookups(self, items):
+        self._write([{"type": "lookup", "key": list(key), "bibcode": bibcode} for key, bibcode in items])
+
+    def record_answer(self, key, bibcode):
+        self._write([{"type": "answer", "key": list(key), "bibcode": bibcode}])
+
+    def record_export(self, texts):
+        self._write([{"type": "export", "bibtex": texts}])
+
+    def close(self, remove=True):
+        self._fp.close()
+        if remove:
+            os.remove(self.path)
+
+
+class RunStats(object):
+    """
+    Wall time of each phase of a run, and a report that adds the request
+    counters of the ADS client and the hit rates of the cache.
+    `add_hook(phase, hook)` attaches a hook to a phase ("*" for all phases):
+    `hook(phase)` is called when the phase starts and must return a context
+    manager, which is entered for the duration of the phase (e.g., a profiler).
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._hooks = defaultdict(list)
+        self._start = time.perf_counter()
+
+    def reset(self):
+        self.phases.clear()
+        self._start = time.perf_counter()
+
+    def add_hook(self, phase, hook):
+        self._hooks[phase].append(hook)
+
+    @contextmanager
+    def phase(self, name):
+        with ExitStack() as stack:
+            for hook in self._hooks[name] + self._hooks["*"]:
+                stack.enter_context(hook(name))
+            t = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - t
+
+    def report(self, client=None, cache=None):
+        report = OrderedDict()
+        report["version"] = __version__
+        report["total_seconds"] = time.perf_counter() - self._start
+        report["phases"] = OrderedDict((k, round(v, 6)) for k, v in self.phases.items())
+        if client is not None:
+            report["requests"] = OrderedDict(
+                [
+                    ("total", client.requests),
+                    ("by_kind", dict(client.requests_by_kind)),
+                    ("retries", client.retries),
+                    ("bytes_sent", client.bytes_sent),
+                    ("bytes_received", client.bytes_received),
+                    ("quota", client.quota),
+                ]
+            )
+        if cache is not None:
+            report["cache"] = OrderedDict(
+                (kind, {"hits": cache.hits[kind], "misses": cache.misses[kind]})
+                for kind in sorted(set(cache.hits) | set(cache.misses))
+            )
+        return report
+
+    @staticmethod
+    def format_report(report):
+        lines = ["Time: {:.3f} s in total".format(report["total_seconds"])]
+        for name, seconds in report["phases"].items():
+            lines.append("  {:<12} {:>9.3f} s".format(name, seconds))
+        requests_ = report.get("requests")
+        if requests_:
+            lines.append(
+                "ADS requests by type: {}; {:.1f} kB sent, {:.1f} kB received".format(
+                    ", ".join(
+                        "{}: {}".format(k, requests_["by_kind"].get(k, 0))
+                        for k in ("identifier", "authoryear", "export")
+                    ),
+                    requests_["bytes_sent"] / 1000.0,
+                    requests_["bytes_received"] / 1000.0,
+                )
+            )
+        if report.get("cache"):
+            lines.append(
+                "Cache hits: "
+                + ", ".join(
+                    "{}: {}/{}".format(kind, c["hits"], c["hits"] + c["misses"])
+                    for kind, c in report["cache"].items()
+                )
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def _profile_phase(phase):
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = "adstex-{}.prof".format(phase)
+        profiler.dump_stats(path)
+        print("Profile of phase '{}' written to {}".format(phase, path), file=sys.stderr)
+
+
+def _get_stats():
+    global _STATS
+    if _STATS is None:
+        _STATS = RunStats()
+    return _STATS
+
+
+def _build_parser():
     parser = ArgumentParser()
     parser.add_argument(
-        "files", metavar="TEX", nargs="+", help="tex files to search citation keys"
+        "files",
+        metavar="TEX",
+        nargs="+",
+        help="tex files to search citation keys (or a bib file to update, "
+        "or a JSON manifest of projects to run in batch)",
     )
     parser.add_argument(
         "-o",
@@ -321,6 +2823,12 @@ def main():
         action="store_true",
         help="for all existing entries, regenerate the bibtex with the latest version from ADS if found",
     )
+    parser.add_argument(
+        "--recheck-all",
+        action="store_true",
+        help="in bib update mode, check all entries for updates, "
+        "including those with a journal bibcode that were checked recently",
+    )
     parser.add_argument(
         "--merge-other",
         action="store_true",
@@ -352,14 +2860,120 @@ def main():
         "-P",
         "-p",
         action="store_true",
-        help="enable parallel ADS update queries",
+        help="enable concurrent ADS queries (run in threads; see --threads); "
+        "without it, the author+year searches that run while you answer the prompts are done one at a time",
     )  # thanks to dwijn for adding this option
     parser.add_argument(
         "--threads",
         default=8,
         type=int,
-        help="specify the number of threads used when --parallel is set (default: 8)",
+        help="specify the number of threads for concurrent ADS queries when --parallel is set "
+        "(default: 8, at most {})".format(_ADS_MAX_THREADS),
     )  # thanks to dwijn for adding this option
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="number of processes for parsing large tex and bib files (default: number of CPUs, up to 8)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="do not read from or write to the local cache of ADS lookups",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="ignore cached ADS lookups (new results are still cached)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        nargs="+",
+        metavar="[KIND=]DAYS",
+        help="lifetime of cached ADS lookups in days, for all kinds or per kind ({}); default: {}".format(
+            ", ".join(sorted(_CACHE_TTL)), " ".join("{}={}".format(k, v) for k, v in sorted(_CACHE_TTL.items()))
+        ),
+    )
+    parser.add_argument(
+        "--auto-select",
+        action="store_true",
+        help="rank the candidates of author+year keys and select the best match without asking when its confidence "
+        "is at least --auto-threshold; the other keys are asked together at the end",
+    )
+    parser.add_argument(
+        "--auto-threshold",
+        type=float,
+        metavar="CONFIDENCE",
+        help="confidence needed to select a candidate with --auto-select (default: {}; implies --auto-select)".format(
+            _AUTO_THRESHOLD
+        ),
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="SNAPSHOT",
+        help="look up identifiers, author+year keys, and bibtex entries in an ADS snapshot "
+        "(see --build-snapshot) before ADS",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="do not connect to ADS; use only the snapshot (--snapshot) and the cache",
+    )
+    parser.add_argument(
+        "--build-snapshot",
+        metavar="SNAPSHOT",
+        help="build an ADS snapshot from the given bib files (e.g., a bulk bibtex export from ADS) and exit",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="only print an estimate of the number of ADS requests this run would send in each phase "
+        "(no network access)",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        metavar="N",
+        help="send at most N ADS requests; new keys come first, "
+        "and the update check of existing entries is left for later runs if needed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume an interrupted run from its journal, skipping the lookups and exports it already finished",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="after the run, keep watching the tex files and add newly cited keys",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        default=1.0,
+        type=float,
+        metavar="SECONDS",
+        help="with --watch, seconds between polls of the tex files (default: 1)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the time spent in each phase, ADS requests by type, and cache hits",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        help="write the statistics of --stats to FILE as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=_PHASES,
+        metavar="PHASE",
+        help="profile a phase with cProfile and write the result to adstex-PHASE.prof; phases: {}".format(
+            ", ".join(_PHASES)
+        ),
+    )
     parser.add_argument(
         "--ignore-env-args",
         action="store_true",
@@ -370,205 +2984,425 @@ def main():
         action="version",
         version="%(prog)s {version}".format(version=__version__),
     )
-    args = parser.parse_args()
+    return parser
+
+
+def _parse_args(parser, argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parser.parse_args(argv)
 
     env_args = os.getenv("ADSTEX_ARGS")
     if env_args and not args.ignore_env_args:
-        args = parser.parse_args(sys.argv[1:] + env_args.strip().split())
+        args = parser.parse_args(argv + env_args.strip().split())
+
+    if args.watch_interval <= 0:
+        parser.error("--watch-interval must be positive")
+    if args.auto_threshold is not None and not 0 < args.auto_threshold <= 1:
+        parser.error("--auto-threshold must be between 0 and 1")
+    if args.auto_select and args.auto_threshold is None:
+        args.auto_threshold = _AUTO_THRESHOLD
+    return args
+
+
+def _make_config(args):
+    return Config(
+        include_physics=args.include_physics,
+        use_coauthors=args.use_coauthors,
+        update=args.update,
+        merge_other=args.merge_other,
+        force_regenerate=args.force_regenerate,
+        auto_threshold=args.auto_threshold,
+        client=AdsClient(
+            max_concurrency=args.threads if args.parallel else 1,
+            max_requests=args.max_requests,
+            offline=args.offline,
+            disable_ssl=args.disable_ssl_verification,
+        ),
+        workers=max(args.workers if args.workers is not None else min(os.cpu_count() or 1, 8), 1),
+    )
 
-    if args.include_physics:
-        global _DATABASE
-        _DATABASE = '("astronomy" OR "physics")'
 
-    if args.disable_ssl_verification:
-        ans = input("You have chosen to disable SSL verification. This will render your API key vulnerable. Do you want to continue? [y/N] ")
-        if ans in ("y", "Y", "yes", "Yes", "YES"):
-            global _DISABLE_SSL
-            _DISABLE_SSL = True
-            warnings.filterwarnings("ignore", "Unverified HTTPS request is being made", Warning)
-        else:
-            print("OK, abort!")
-            return
+def _open_stores(config, args, parser):
+    # the snapshot and the cache that the lookups read before ADS
+    if args.snapshot:
+        try:
+            config.snapshot = AdsSnapshot(args.snapshot)
+        except (IOError, ValueError) as e:
+            parser.error("Cannot open ADS snapshot: {}".format(e))
+
+    if args.cache:
+        cache_ttl = {}
+        for item in args.cache_ttl or []:
+            kind, _, days = item.rpartition("=")
+            try:
+                days = float(days)
+            except ValueError:
+                parser.error("Invalid --cache-ttl value: {}".format(item))
+            for k in [kind] if kind else _CACHE_TTL:
+                if k not in _CACHE_TTL:
+                    parser.error("Unknown cache kind in --cache-ttl: {}".format(k))
+                cache_ttl[k] = days
+        try:
+            config.cache = AdsCache(ttl=cache_ttl, refresh=args.refresh_cache)
+        except (OSError, sqlite3.Error) as e:
+            warnings.warn("Cannot open the adstex cache ({}); continuing without it.".format(e))
+
+
+def _run_build_snapshot(args, parser):
+    try:
+        n = build_snapshot(args.build_snapshot, args.files)
+    except IOError as e:
+        parser.error("Cannot build ADS snapshot: {}".format(e))
+    print("{} records written to {}".format(n, args.build_snapshot))
 
-    if args.use_coauthors:
-        global _USE_COAUTHORS
-        _USE_COAUTHORS = True
+
+def _load_projects(args, parser, stats):
+    """Return the projects of this run, whether it runs in batch mode, and whether it runs in bib update mode."""
+    if len(args.files) == 1 and args.files[0].lower().endswith(".json"):  # batch mode
+        msg = "Input file is a JSON manifest, not tex file. This will enter batch mode."
+        if args.output or args.other:
+            parser.error(msg + " Do not specify `--output` and `--other` in this mode.")
+        if args.watch:
+            parser.error(msg + " Cannot --watch in this mode.")
+        with stats.phase("scan_tex"):
+            try:
+                projects = _load_manifest(args.files[0])
+            except (IOError, ValueError, KeyError, TypeError) as e:
+                parser.error("Cannot read batch manifest {}: {}".format(args.files[0], e))
+        return projects, True, False
 
     if len(args.files) == 1 and args.files[0].lower().endswith(".bib"):  # bib update mode
+        msg = "Input file is a bib file, not tex file. This will enter bib update mode."
         if args.output or args.other:
-            parser.error(
-                "Input file is a bib file, not tex file. This will enter bib update mode. Do not specify `--output` and `--other` together in this mode."
-            )
+            parser.error(msg + " Do not specify `--output` and `--other` together in this mode.")
         if not args.update:
-            parser.error(
-                "Input file is a bib file, not tex file. This will enter bib update mode. Must not specify --no-update"
-            )
+            parser.error(msg + " Must not specify --no-update")
+        if args.watch:
+            parser.error(msg + " Cannot --watch a bib file.")
         if not os.path.isfile(args.files[0]):
             parser.error("Cannot locate input bib file {}".format(args.files[0]))
-        keys = None
-        args.output = args.files[0]
+        return [_Project(args.files, args.files[0])], False, True
+
+    if args.output:  # bib output is specified
+        with stats.phase("scan_tex"):
+            keys, _ = search_keys(args.files, find_bib=False)
+        return [_Project(args.files, args.output, args.other, keys)], False, False
+
+    # bib output is missing, auto-identify
+    with stats.phase("scan_tex"):
+        keys, output, other = _find_project_bibs(args.files)
+    if output is None:
+        parser.error(
+            "Cannot identify bibtex file from the tex source. Use -o to specify a bibtex file as output."
+        )
+    project = _Project(args.files, output, (args.other or []) + other, keys)
 
-    elif args.output:  # bib output is specified
-        keys, _ = search_keys(args.files, find_bib=False)
+    msg = "Auto-identifying bibtex files...\n"
+    msg += "Main bibtex source (output file): {}\n".format(output)
+    if project.other:
+        msg += "Additional bibtex sources: {}\n".format(", ".join(project.other))
+    print(_headerize(msg))
+    return [project], False, False
 
-    else:  # bib output is missing, auto-identify
-        keys, bib = search_keys(args.files, find_bib=True)
-        if not bib:
-            parser.error(
-                "Cannot identify bibtex file from the tex source. Use -o to specify a bibtex file as output."
+
+def _defer_refreshes(plan, projects, pending, max_requests):
+    # leave the update checks that do not fit in the budget for a later run, and look up the new keys first
+    deferred = plan.defer_refreshes(max_requests)
+    if deferred:
+        print(
+            "Leaving the update check of {} existing entries for a later run "
+            "to stay within --max-requests.".format(len(deferred))
+        )
+    for i, key in deferred:
+        projects[i].deferred.add(key)
+    refreshes = plan.refreshes
+    pending = [item for item in pending if item[0] not in deferred]
+    pending.sort(key=lambda item: item[0] in refreshes)  # new keys first
+    return pending
+
+
+def _resolve_projects(projects, lookups, pending, local, journal, args):
+    # resolve the identifiers of all projects together, so that each distinct identifier is looked up once
+    resolved = {key: bibcode for key, bibcode in journal.lookups.items() if bibcode and key in lookups}
+    failed = set()
+    for n in range(0, len(pending), _JOURNAL_GROUP_SIZE):
+        group = pending[n : n + _JOURNAL_GROUP_SIZE]
+        resolved_group, failed_group = batch_id2bibcode(OrderedDict(group))
+        resolved.update(resolved_group)
+        failed.update(failed_group)
+        journal.record_lookups((key, resolved_group.get(key)) for key, _ in group if key not in failed_group)
+    checked = []
+    for (i, key), bibcode in resolved.items():
+        entry = projects[i].bib.entries_dict.get(key)
+        if entry is not None:
+            checked.extend(b for b in (bibcode, extract_bibcode(entry)) if b)
+    record_checked(checked)
+    for i, project in enumerate(projects):
+        resolved_this = dict(local[i])
+        resolved_this.update((key, bibcode) for (j, key), bibcode in resolved.items() if j == i)
+        failed_this = {key for j, key in failed if j == i}
+        project.results = [
+            _resolve_key(
+                key,
+                project.bib,
+                project.bib_other,
+                resolved_this,
+                failed_this,
+                args.update,
+                args.merge_other,
+                args.force_regenerate,
+                project.fresh,
+                project.deferred,
             )
-        args.output = bib.pop(0)
-        if args.other:
-            args.other.extend(bib)
+            for key in project.keys
+        ]
+
+
+def _ask_interactive(projects, interactive, journal, auto_threshold, batch):
+    """Return the bibcode chosen for each (project index, key) in *interactive*."""
+    to_answer = OrderedDict.fromkeys(key for i, key in interactive if (i, key) not in journal.answers)
+    prefetched = prefetch_authoryear(to_answer)
+    print(_headerize("Resolving keys that do not contain identifiers..."))
+    answers = {}
+    rankings = {}
+    shown = []
+
+    def print_project(i):
+        # in batch mode, name the project before its keys
+        if batch and shown[-1:] != [i]:
+            print(_headerize("Project: {}".format(projects[i].output)))
+            shown.append(i)
+
+    if auto_threshold is not None:
+        # select the confident matches first, so that only the other keys are asked, one after another
+        to_rank = [item for item in interactive if item not in journal.answers]
+        rankings = rank_interactive(projects, to_rank, prefetched)
+        for item in to_rank:
+            if rankings.get(item) and rankings[item][0][0] >= auto_threshold:
+                confidence, candidate = rankings[item][0]
+                answers[item] = candidate.bibcode
+                journal.record_answer(item, answers[item])
+                print_project(item[0])
+                print(
+                    "{}: NEW ENTRY => {} (AUTO-SELECTED, {:.0%} CONFIDENCE)".format(item[1], answers[item], confidence)
+                )
+        to_ask = len(to_rank) - len(answers)
+        if to_ask:
+            print(_headerize("Keys that need your choice: {}".format(to_ask)))
+    for item in interactive:
+        if item in answers:  # auto-selected
+            continue
+        i, key = item
+        print_project(i)
+        if item in journal.answers:
+            answers[item] = journal.answers[item]
         else:
-            args.other = bib
+            ranked = [c for _, c in rankings[item]] if item in rankings else None
+            try:
+                answers[item] = find_bibcode_interactive(key, prefetched.get(key), ranked)
+            except AdsUnavailableError:
+                answers[item] = AdsUnavailableError
+                print("{}: ADS UNAVAILABLE".format(key))
+                continue
+            journal.record_answer(item, answers[item])
+        if answers[item]:
+            print("{}: NEW ENTRY => {}".format(key, answers[item]))
+        else:
+            print("{}: NOT FOUND".format(key))
+    return answers
+
+
+def _export_projects(projects, journal):
+    # export each distinct bibcode once
+    to_retrieve = sorted(set(b for project in projects for b in project.to_retrieve))
+    if not to_retrieve:
+        return
+    print(_headerize("Building new bibtex file, please wait..."))
+    with _get_stats().phase("export"):
+        bib_new, failed = export_bibtex(to_retrieve, texts=journal.bibtex, on_chunk=journal.record_export)
+    exported = OrderedDict()
+    for entry in bib_new.entries:
+        print(entry["ID"])
+        exported[entry["ID"]] = entry
+    failed = set(failed)
+    for project in projects:
+        failed_this = sorted(failed.intersection(project.to_retrieve))
+        if failed_this:
+            print(_headerize("The following entries could not be retrieved from ADS; please run adstex again"))
+            for b in failed_this:
+                print("{} ({})".format(b, ", ".join(project.all_entries[b])))
+        bib_this = bibtexparser.bibdatabase.BibDatabase()
+        bib_this.entries = [
+            dict(entry, ID=project.all_entries[b][0])
+            for b, entry in exported.items()
+            if b in project.to_retrieve
+        ]
+        project.bib = update_bib(project.bib, bib_this)
+        project.changed.extend(bib_this.entries)
+
+
+def _report_run(args, stats, config, version_check):
+    if args.stats or args.stats_json:
+        report = stats.report(config.client, config.cache)
+        if args.stats:
+            print(_headerize(RunStats.format_report(report)))
+        if args.stats_json:
+            with open(args.stats_json, "w") as fp:
+                json.dump(report, fp, indent=2)
+    if config.client.requests:
+        print(config.client.report())
 
-        msg = "Auto-identifying bibtex files...\n"
-        msg += "Main bibtex source (output file): {}\n".format(args.output)
-        if args.other:
-            msg += "Additional bibtex sources: {}\n".format(", ".join(args.other))
-        print(_headerize(msg))
+    print(_headerize("Done!"))
 
-    if os.path.isfile(args.output):
-        with open(args.output) as fp:
-            bib = bibtexparser.load(fp, parser=get_bparser())
-    else:
-        bib = bibtexparser.loads(" ", parser=get_bparser())
-
-    bib_other = bibtexparser.loads(" ", parser=get_bparser())
-    if args.other:
-        for f in args.other:
-            with open(f) as fp:
-                bib_other = update_bib(
-                    bib_other, bibtexparser.load(fp, parser=get_bparser())
-                )
+    # report a newer version only if the check is done, so that the run does not wait for PyPI;
+    # a check still running caches its result if it finishes before adstex exits
+    latest_version = None
+    if version_check is not None and version_check.done():
+        latest_version = version_check.result()
 
-    if keys is None:  # bib update mode
-        keys = list(bib.entries_dict)
-
-    interactive = set()
-    not_found = set()
-    to_retrieve = set()
-    all_entries = defaultdict(list)
-
-    def update(key):
-        key_exists = key in bib.entries_dict
-        key_exists_in_others = key in bib_other.entries_dict
-
-        if args.update:
-            if key_exists:
-                bibcode = extract_bibcode(bib.entries_dict[key])
-                bibcode_new = entry2bibcode(bib.entries_dict[key])
-            elif key_exists_in_others and args.merge_other:
-                bibcode = extract_bibcode(bib_other.entries_dict[key])
-                bibcode_new = entry2bibcode(bib_other.entries_dict[key])
-            else:
-                bibcode_new = None
-
-            if bibcode_new:
-                all_entries[bibcode_new].append(key)
-                if bibcode_new != bibcode or args.force_regenerate:
-                    to_retrieve.add(bibcode_new)
-                    print(
-                        "{}:{} UPDATE => {}".format(
-                            key,
-                            "" if key_exists else " FOUND IN SECONDARY BIB SOURCES,",
-                            bibcode_new,
-                        )
-                    )
-                    return
+    config.close()
 
-        if key_exists:
-            print("{}: EXISTING".format(key))
-            return
+    if latest_version and _is_newer_version(latest_version):
+        msg = "A newer version of adstex (v{}) is now available!\n".format(
+            latest_version
+        )
+        msg += "Please consider updating it by running:\n\n"
+        msg += "pip install adstex=={}".format(latest_version)
+        print(_headerize(msg))
 
-        if key_exists_in_others and args.merge_other:
-            bib.entries.append(bib_other.entries_dict[key])
-            print("{}: FOUND IN OTHER BIB SOURCE, MERGED".format(key))
-            return
 
-        if key_exists_in_others:
-            print("{}: FOUND IN OTHER BIB SOURCE, IGNORED".format(key))
-            return
+def main():
+    parser = _build_parser()
+    args = _parse_args(parser)
 
-        bibcode = id2bibcode(key)
-        if bibcode:
-            to_retrieve.add(bibcode)
-            all_entries[bibcode].append(key)
-            print("{}: NEW ENTRY => {}".format(key, bibcode))
+    if args.disable_ssl_verification:
+        ans = input(
+            "You have chosen to disable SSL verification. This will render your API key vulnerable. "
+            "Do you want to continue? [y/N] "
+        )
+        if ans in ("y", "Y", "yes", "Yes", "YES"):
+            warnings.filterwarnings("ignore", "Unverified HTTPS request is being made", Warning)
+        else:
+            print("OK, abort!")
             return
 
-        # if all above failed
-        interactive.add(key)
+    config = _make_config(args)
+    _CONFIG.set(config)
+    _MEMO.set({})
 
-    if args.parallel:
-        Parallel(n_jobs=args.threads, prefer="threads")(delayed(update)(key) for key in keys)
-    else:
-        [update(key) for key in keys]
+    if args.build_snapshot:
+        _run_build_snapshot(args, parser)
+        return
 
-    if interactive:
-        print(_headerize("Resolving keys that do not contain identifiers..."))
-        for key in interactive:
-            bibcode = find_bibcode_interactive(key)
-            if bibcode:
-                to_retrieve.add(bibcode)
-                all_entries[bibcode].append(key)
-                print("{}: NEW ENTRY => {}".format(key, bibcode))
-            else:
-                not_found.add(key)
-                print("{}: NOT FOUND".format(key))
-
-    if not_found:
-        print(_headerize("Please check the following keys"))
-        for key in not_found:
-            print(key)
-
-    repeated_keys = [t for t in all_entries.items() if len(t[1]) > 1]
-    if repeated_keys:
-        print(_headerize("The following keys refer to the same entry"))
-        for b, k in repeated_keys:
-            print(
-                "{1} has been referred as the following keys; please keep only one:\n{0}\n".format(
-                    " ".join(k), b
-                )
-            )
+    stats = _get_stats()
+    stats.reset()
+    for phase in set(args.profile or []):
+        stats.add_hook(phase, _profile_phase)
 
-    if to_retrieve:
-        print(_headerize("Building new bibtex file, please wait..."))
-        bib_new = bibtexparser.loads(
-            fixedAdsExportQuery(list(to_retrieve), "bibtex").execute(), parser=get_bparser()
-        )
-        for entry in bib_new.entries:
-            print(entry["ID"])
-            entry["ID"] = all_entries[entry["ID"]][0]
-        bib = update_bib(bib, bib_new)
-        bib_dump_str = bibtexparser.dumps(bib).encode("utf8")
-        if args.backup and os.path.isfile(args.output):
-            copyfile(args.output, args.output + ".bak")
-        with open(args.output, "wb") as fp:
-            fp.write(bib_dump_str)
-    else:
-        print('Nothing to write/update.')
+    _open_stores(config, args, parser)
 
-    print(_headerize("Done!"))
+    version_check = None if args.plan or args.offline else _start_version_check()
 
-    # check version
-    try:
-        latest_version = packaging.version.parse(
-            requests.get(
-                "https://pypi.python.org/pypi/adstex/json", timeout=0.1,
-            ).json()["info"]["version"]
+    projects, batch, bib_update_mode = _load_projects(args, parser, stats)
+
+    journal = None
+    if not args.plan:
+        journal = RunJournal(
+            (args.files[0] if batch else projects[0].output) + ".adstex-journal",
+            _journal_header(projects, args),
+            resume=args.resume,
         )
-    except (requests.RequestException, KeyError, ValueError):
-        pass
-    else:
-        if latest_version > packaging.version.parse(__version__):
-            msg = "A newer version of adstex (v{}) is now available!\n".format(
-                latest_version
+        if journal.resumed:
+            print(_headerize("Resuming the interrupted run recorded in {}".format(journal.path)))
+
+    with stats.phase("load_bib"):
+        for project in projects:
+            project.load()
+    if bib_update_mode and not (args.recheck_all or args.force_regenerate):
+        projects[0].fresh = fresh_keys(projects[0].bib.entries_dict)
+        if projects[0].fresh:
+            print(
+                "Skipping the update check of {} entries that were checked recently "
+                "(use --recheck-all to check them).".format(len(projects[0].fresh))
             )
-            msg += "Please consider updating it by running:\n\n"
-            msg += "pip install adstex=={}".format(latest_version)
-            print(_headerize(msg))
+    for project in projects:
+        if batch and project.duplicates:
+            print(_headerize("Project: {}".format(project.output)))
+        project.report_duplicates()
+
+    lookups = OrderedDict()
+    local = []
+    for i, project in enumerate(projects):
+        lookups_this, local_this = project.lookups(args.update, args.merge_other)
+        for key, ids in lookups_this.items():
+            lookups[(i, key)] = ids
+        local.append(local_this)
+    pending = [item for item in lookups.items() if journal is None or item[0] not in journal.lookups]
+
+    if args.plan or args.max_requests is not None:
+        plan = RequestPlan(projects, OrderedDict(pending), local, args.update, args.merge_other, args.force_regenerate)
+    if args.plan:
+        print(_headerize(plan.format()))
+        config.close()
+        return
+    if args.max_requests is not None:
+        pending = _defer_refreshes(plan, projects, pending, args.max_requests)
+
+    with stats.phase("resolve"):
+        _resolve_projects(projects, lookups, pending, local, journal, args)
+
+    for project in projects:
+        if batch:
+            print(_headerize("Project: {}".format(project.output)))
+        project.merge_results()
+
+    # a key is asked for in each project that cites it, as the same key may name different papers in
+    # different projects; the author+year search of a key shared by several projects runs once
+    interactive = [(i, key) for i, project in enumerate(projects) for key in project.interactive]
+    if interactive:
+        with stats.phase("interactive"):
+            answers = _ask_interactive(projects, interactive, journal, args.auto_threshold, batch)
+        for i, project in enumerate(projects):
+            for key in project.interactive:
+                bibcode = answers[(i, key)]
+                if bibcode is AdsUnavailableError:
+                    project.unavailable.append(key)
+                elif bibcode:
+                    project.to_retrieve.add(bibcode)
+                    project.all_entries[bibcode].append(key)
+                else:
+                    project.not_found.append(key)
+
+    for project in projects:
+        if batch and (project.not_found or project.unavailable):
+            print(_headerize("Project: {}".format(project.output)))
+        project.report()
+
+    _export_projects(projects, journal)
+
+    for project in projects:
+        with stats.phase("write_bib"):
+            written = project.changed and write_bib(project.output, project.changed, backup=args.backup)
+        if not written:
+            print('Nothing to write/update{}.'.format(" in " + project.output if batch else ""))
+        elif batch:
+            print("{} updated.".format(project.output))
+    journal.close()
+
+    if args.watch:
+        project = projects[0]
+        watch(
+            project.files,
+            project.output,
+            project.bib,
+            project.bib_other,
+            project.keys,
+            args.merge_other,
+            args.backup,
+            args.watch_interval,
+        )
+
+    _report_run(args, stats, config, version_check)
 
 
 if __name__ == "__main__":
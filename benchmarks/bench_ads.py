@@ -0,0 +1,201 @@
+"""
+Offline benchmark of the ADS lookup paths of adstex against a local stub server.
+
+Starts `stub_ads.StubAdsServer` and runs each scenario in a fresh interpreter
+on synthetic TeX and bib corpora, serially and with --parallel. For each run
+it reports the wall time, the requests the stub received (and how many it
+answered with an error), and the peak RSS of the process running adstex.
+
+Scenarios:
+  main-new       adstex paper.tex -o refs.bib, all keys new (identifiers)
+  main-update    adstex paper.tex -o refs.bib, all keys already in refs.bib
+  id2bibcode     id2bibcode() for each key
+  entry2bibcode  entry2bibcode() for each bib entry
+  export         export_bibtex() for all bibcodes
+
+Usage: python benchmarks/bench_ads.py [--sizes 10 100 1000 10000] [--latency SECONDS]
+           [--error-rate FRACTION] [--rate-limit N] [--threads N] [--scenarios ...]
+"""
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_root = os.path.join(_here, os.pardir)
+sys.path.insert(0, _here)
+from stub_ads import StubAdsServer, fake_bibcode  # noqa: E402
+
+_scenarios = ("main-new", "main-update", "id2bibcode", "entry2bibcode", "export")
+
+
+def synthetic_ids(n):
+    ids = []
+    for i in range(n):
+        if i % 3 == 0:
+            ids.append("{:04d}.{:05d}".format(1501 + i // 100000 % 900, i % 100000))
+        elif i % 3 == 1:
+            ids.append("10.1000/bench.{}".format(i))
+        else:
+            ids.append("2020ApJ..{:09d}B".format(i))
+    return ids
+
+
+def write_corpus(workdir, n):
+    ids = synthetic_ids(n)
+    with open(os.path.join(workdir, "paper.tex"), "w") as f:
+        f.write("\\documentclass{article}\n\\begin{document}\n")
+        for i in range(0, n, 5):
+            f.write("Some text \\citep{{{}}}.\n\n".format(", ".join(ids[i : i + 5])))
+        f.write("\\end{document}\n")
+    with open(os.path.join(workdir, "existing.bib"), "w") as f:
+        for i, id_this in enumerate(ids):
+            bibcode = fake_bibcode(id_this)
+            extra = ""
+            if i % 3 == 0:
+                extra = "      eprint = {{{}}},\n".format(id_this)
+            elif i % 3 == 1:
+                extra = "         doi = {{{}}},\n".format(id_this)
+            f.write(
+                "@ARTICLE{{{0},\n      author = {{{{Doe}}, J.}},\n       title = \"{{Synthetic entry {1}}}\",\n"
+                "        year = 2020,\n{2}      adsurl = {{https://ui.adsabs.harvard.edu/abs/{1}}},\n}}\n\n".format(
+                    id_this, bibcode, extra
+                )
+            )
+    return ids
+
+
+def peak_rss_mb():
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def child(args):
+    """Run one scenario in this (fresh) process and print the result as JSON."""
+    sys.path.insert(0, _root)
+    import adstex
+
+    StubAdsServer.patch_ads(args.url)
+    adstex._fetch_latest_version = lambda: None
+    threads = args.threads if args.parallel else 1
+    ids = synthetic_ids(args.n)
+    tex = os.path.join(args.workdir, "paper.tex")
+    out = os.path.join(args.workdir, "refs.bib")
+    if args.child.startswith("main-"):
+        if args.child == "main-update":
+            shutil.copy(os.path.join(args.workdir, "existing.bib"), out)
+        elif os.path.exists(out):
+            os.remove(out)
+        sys.argv = ["adstex", tex, "-o", out, "--no-cache", "--no-backup", "--ignore-env-args"]
+        if args.parallel:
+            sys.argv += ["--parallel", "--threads", str(threads)]
+    else:
+        client = adstex.AdsClient(max_concurrency=threads)
+        adstex._CONFIG.set(adstex.Config(client=client))
+        if args.child == "entry2bibcode":
+            with open(os.path.join(args.workdir, "existing.bib")) as f:
+                entries = adstex.bibtexparser.load(f, parser=adstex.get_bparser()).entries
+
+    stdout = sys.stdout
+    unavailable = False
+    t = time.perf_counter()
+    with open(os.devnull, "w") as sys.stdout:
+        try:
+            if args.child.startswith("main-"):
+                adstex.main()
+            elif args.child == "id2bibcode":
+                client.map(adstex.id2bibcode, ids)
+            elif args.child == "entry2bibcode":
+                client.map(adstex.entry2bibcode, entries)
+            elif args.child == "export":
+                adstex.export_bibtex([fake_bibcode(id_this) for id_this in ids])
+        except adstex.AdsUnavailableError:
+            unavailable = True
+    t = time.perf_counter() - t
+    sys.stdout = stdout
+    print(json.dumps({"time": t, "rss": peak_rss_mb(), "unavailable": unavailable}))
+
+
+def run_scenario(server, scenario, n, parallel, threads, workdir):
+    server.reset_counters()
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", scenario, "--url", server.url]
+    cmd += ["--n", str(n), "--threads", str(threads), "--workdir", workdir]
+    if parallel:
+        cmd.append("--parallel")
+    env = dict(os.environ, ADS_API_TOKEN="benchmark", ADSTEX_CACHE_DIR=workdir)
+    p = subprocess.run(cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, universal_newlines=True)
+    if p.returncode:
+        return None
+    result = json.loads(p.stdout.strip().splitlines()[-1])
+    result["requests"] = sum(server.requests.values())
+    result["errors"] = server.errors
+    return result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="numbers of keys")
+    parser.add_argument("--scenarios", nargs="+", choices=_scenarios, default=list(_scenarios))
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to each stub response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="requests allowed before HTTP 429")
+    parser.add_argument("--threads", type=int, default=8, help="number of concurrent queries for --parallel runs")
+    parser.add_argument("--child", choices=_scenarios, help="internal: run one scenario")
+    parser.add_argument("--url", help="internal: stub server URL")
+    parser.add_argument("--n", type=int, help="internal: number of keys")
+    parser.add_argument("--parallel", action="store_true", help="internal: run with --parallel")
+    parser.add_argument("--workdir", help="internal: corpus directory")
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    server = StubAdsServer(latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit).start()
+    print(
+        "stub ADS: latency {:.0f} ms, error rate {:.0%}, rate limit {}".format(
+            args.latency * 1000, args.error_rate, args.rate_limit
+        )
+    )
+    print(
+        "{:<14} {:>6} {:<12} {:>9} {:>9} {:>7} {:>9}".format(
+            "scenario", "keys", "mode", "time (s)", "requests", "errors", "RSS (MB)"
+        )
+    )
+    workdir = tempfile.mkdtemp(prefix="adstex-bench-")
+    try:
+        for n in args.sizes:
+            write_corpus(workdir, n)
+            for scenario in args.scenarios:
+                for parallel in (False, True):
+                    mode = "parallel={}".format(args.threads) if parallel else "serial"
+                    r = run_scenario(server, scenario, n, parallel, args.threads, workdir)
+                    if r is None:
+                        print("{:<14} {:>6} {:<12} {:>9}".format(scenario, n, mode, "failed"))
+                        continue
+                    print(
+                        "{:<14} {:>6} {:<12} {:>9.2f} {:>9} {:>7} {:>9.1f}{}".format(
+                            scenario,
+                            n,
+                            mode,
+                            r["time"],
+                            r["requests"],
+                            r["errors"],
+                            r["rss"],
+                            "  (ADS unavailable)" if r["unavailable"] else "",
+                        )
+                    )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
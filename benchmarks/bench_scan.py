@@ -0,0 +1,123 @@
+"""
+Benchmark of the TeX citation scanner on synthetic multi-megabyte inputs.
+
+Compares `adstex._scan_tex` with the regex-based scanner used up to v0.6.1
+(kept below for reference) and checks that both find the same citation keys.
+
+Usage: python benchmarks/bench_scan.py [--size MB] [--repeat N]
+"""
+from __future__ import print_function
+
+import os
+import random
+import re
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import adstex  # noqa: E402
+
+_legacy_re_comment = re.compile(r"(?<!\\)%.*(?=[\r\n])")
+_legacy_re_cite = re.compile(
+    r"\\(?:bibentry|[cC]ite[a-zA]{0,7})\*?(?:(?!\n{2,})\s)*"
+    r"(?:(?<!\\)[\[<](?:(?!\n{2,}).)*?(?<!\\)[\]>](?:(?!\n{2,})\s)*)*{((?:(?!\n{2,})[^{}])+)}",
+    re.S,
+)
+
+
+def legacy_scan(text):
+    text = _legacy_re_comment.sub("", text)
+    return [k.strip() for m in _legacy_re_cite.finditer(text) for k in m.groups()[0].split(",")]
+
+
+def _random_key(rng):
+    return rng.choice(
+        (
+            "{}.{:05d}".format(rng.randint(1500, 2412), rng.randint(0, 99999)),
+            "10.1093/mnras/stx{}".format(rng.randint(1000, 9999)),
+            "Author{}:{}".format(rng.randint(0, 999), rng.randint(1990, 2024)),
+        )
+    )
+
+
+def make_prose(size, rng):
+    parts = []
+    total = 0
+    while total < size:
+        s = "Some text about galaxies \\citep[e.g.,][]{{{}, {}}} and more text % a comment \\cite{{ignored}}\n".format(
+            _random_key(rng), _random_key(rng)
+        )
+        if rng.random() < 0.1:
+            s += "\n"
+        parts.append(s)
+        total += len(s)
+    return "".join(parts)
+
+
+def make_long_lines(size, rng):
+    # generated tables: very long lines, no blank lines, cites with optional arguments
+    row = " & ".join("{:.3f}".format(rng.random()) for _ in range(20))
+    parts = []
+    total = 0
+    while total < size:
+        s = "{} & \\citet[Tab.~{}]{{{}}} \\\\ ".format(row, rng.randint(1, 9), _random_key(rng))
+        if rng.random() < 0.001:
+            s += "\n"
+        parts.append(s)
+        total += len(s)
+    return "".join(parts)
+
+
+def make_unclosed_options(size, rng):
+    # many `\cite[` whose optional argument is never closed within a long paragraph
+    parts = []
+    total = 0
+    while total < size:
+        s = "value \\cite[see {} and ".format(rng.randint(0, 999))
+        parts.append(s)
+        total += len(s)
+    return "".join(parts) + "\\cite{final}\n"
+
+
+def bench(func, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--size", type=float, default=4, help="size of each synthetic input in MB (default: 4)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repeats; the best time is reported")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    size = int(args.size * 1024 * 1024)
+    cases = (
+        ("prose", make_prose(size, rng)),
+        ("long lines", make_long_lines(size, rng)),
+        ("unclosed [", make_unclosed_options(size // 64, rng)),
+    )
+
+    print("{:<12} {:>8} {:>12} {:>12} {:>8}  {}".format("input", "MB", "legacy (s)", "adstex (s)", "speedup", "same keys"))
+    for name, text in cases:
+        t_legacy, keys_legacy = bench(legacy_scan, text, args.repeat)
+        t_new, scan = bench(adstex._scan_tex, text, args.repeat)
+        print(
+            "{:<12} {:>8.2f} {:>12.3f} {:>12.3f} {:>7.1f}x  {}".format(
+                name,
+                len(text) / 1048576.0,
+                t_legacy,
+                t_new,
+                t_legacy / t_new,
+                set(keys_legacy) == set(scan["keys"]),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Startup-time benchmark of adstex.
+
+Reports the median wall time of `import adstex` and `adstex --help` in fresh
+interpreters, the cumulative import time of adstex and of the heavy dependencies
+it imports lazily (from `python -X importtime`), and what importing those
+dependencies eagerly would cost.
+
+Usage: python benchmarks/bench_startup.py [--repeat N]
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+_heavy_modules = ("ads", "bibtexparser", "requests", "packaging.version", "asyncio", "sqlite3", "mmap")
+
+
+def run_python(args, repeat):
+    env = dict(os.environ, PYTHONPATH=_root)
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, cwd=_root, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - t)
+    return sorted(times)[len(times) // 2]
+
+
+def import_times(statement):
+    env = dict(os.environ, PYTHONPATH=_root)
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env,
+        cwd=_root,
+        check=True,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    cumulative = {}
+    for line in p.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative[parts[2].strip()] = int(parts[1]) / 1000.0
+        except ValueError:
+            pass  # header line
+    return cumulative
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=11, help="number of runs; the median is reported")
+    args = parser.parse_args()
+
+    baseline = run_python(["-c", "pass"], args.repeat)
+    print("{:<40} {:>10}".format("command (median of {} runs)".format(args.repeat), "time (ms)"))
+    for label, cmd in (
+        ("python -c pass", ["-c", "pass"]),
+        ("import adstex", ["-c", "import adstex"]),
+        ("adstex --help", ["-c", "import sys, adstex; sys.argv[1:] = ['--help']; adstex.main()"]),
+        (
+            "import adstex + heavy dependencies",
+            ["-c", "import adstex, " + ", ".join(_heavy_modules)],
+        ),
+    ):
+        t = baseline if cmd == ["-c", "pass"] else run_python(cmd, args.repeat)
+        print("{:<40} {:>10.1f}".format(label, t * 1000))
+
+    print()
+    cumulative = import_times("import adstex")
+    print("cumulative import time of adstex: {:.1f} ms".format(cumulative.get("adstex", float("nan"))))
+    eager = import_times("import " + ", ".join(_heavy_modules))
+    for name in _heavy_modules:
+        print(
+            "  {:<20} {:>8.1f} ms if imported eagerly; imported at startup: {}".format(
+                name, eager.get(name, float("nan")), name in cumulative
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
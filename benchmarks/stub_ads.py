@@ -0,0 +1,187 @@
+"""
+A local stand-in for the ADS search and export endpoints, for offline benchmarks.
+
+Identifier searches resolve every identifier to a deterministic fake bibcode,
+author+year searches return a few fake candidates, and the export endpoint
+returns a minimal bibtex entry per bibcode. Latency, error rate and the
+rate-limit headers (X-RateLimit-Limit/Remaining/Reset) are configurable.
+
+Run it standalone with `python benchmarks/stub_ads.py --port 8000`, or use
+`StubAdsServer` from Python; `StubAdsServer.patch_ads()` points the ads
+client library at the server.
+"""
+from __future__ import print_function
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from argparse import ArgumentParser
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # pragma: no cover
+    raise SystemExit("stub_ads requires Python 3.7+")
+
+_re_bibcode = re.compile(r"^\d{4}\D\S{13}[A-Z.:]$")
+_re_quoted = re.compile(r'"([^"]+)"')
+
+
+def fake_bibcode(identifier):
+    if _re_bibcode.match(identifier):
+        return identifier
+    n = int(hashlib.md5(identifier.lower().encode("utf8")).hexdigest(), 16) % 10**9
+    return "2020ApJ..{:09d}B".format(n)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, kind, payload):
+        server = self.server.stub
+        code, body = server.account(kind)
+        if code == 200:
+            body = json.dumps(payload).encode("utf8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in server.rate_limit_headers():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        q = query.get("q", [""])[0]
+        rows = int(query.get("rows", ["50"])[0])
+        docs = []
+        if q.startswith("identifier:"):
+            kind = "identifier"
+            for identifier in _re_quoted.findall(q):
+                bibcode = fake_bibcode(identifier)
+                docs.append({"id": bibcode, "bibcode": bibcode, "identifier": [bibcode, identifier]})
+        else:
+            kind = "authoryear"
+            author = re.search(r'author:"\^?([^",]+)', q)
+            author = author.group(1) if author else "Anonymous"
+            year = re.search(r"year:(\d+)", q)
+            year = year.group(1) if year else "2020"
+            for i in range(self.server.stub.candidates):
+                bibcode = fake_bibcode("{}:{}:{}".format(author, year, i))
+                docs.append(
+                    {
+                        "id": bibcode,
+                        "bibcode": bibcode,
+                        "author": ["{}, A.".format(author), "Other, B."],
+                        "title": ["Paper {} by {} ({})".format(i, author, year)],
+                        "citation_count": 100 - i,
+                    }
+                )
+        docs = docs[:rows]
+        self._respond(
+            kind,
+            {"responseHeader": {"params": {"rows": str(rows)}}, "response": {"numFound": len(docs), "docs": docs}},
+        )
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        bibcodes = json.loads(self.rfile.read(length).decode("utf8")).get("bibcode", [])
+        export = "\n\n".join(
+            "@ARTICLE{{{0},\n       author = {{{{Doe}}, J.}},\n        title = \"{{Synthetic entry {0}}}\",\n"
+            "         year = 2020,\n       adsurl = {{https://ui.adsabs.harvard.edu/abs/{0}}},\n}}".format(b)
+            for b in bibcodes
+        )
+        self._respond("export", {"export": export})
+
+
+class StubAdsServer(object):
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, rate_limit=5000, reset_seconds=3600, candidates=5, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.reset_seconds = reset_seconds
+        self.candidates = candidates
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_counters()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/v1".format(self._server.server_address[1])
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = {"identifier": 0, "authoryear": 0, "export": 0}
+            self.errors = 0
+            self.remaining = self.rate_limit
+            self.reset_at = int(time.time()) + self.reset_seconds
+
+    def account(self, kind):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests[kind] += 1
+            if self.remaining <= 0:
+                self.errors += 1
+                return 429, b"Too many requests"
+            self.remaining -= 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return 503, b"Service unavailable"
+        return 200, None
+
+    def rate_limit_headers(self):
+        with self._lock:
+            return [
+                ("X-RateLimit-Limit", str(self.rate_limit)),
+                ("X-RateLimit-Remaining", str(max(self.remaining, 0))),
+                ("X-RateLimit-Reset", str(self.reset_at)),
+            ]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ads")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def patch_ads(url):
+        import ads.export
+        import ads.search
+
+        ads.search.SearchQuery.HTTP_ENDPOINT = url + "/search/query"
+        ads.export.ExportQuery.HTTP_ENDPOINT = url + "/export"
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="requests allowed before HTTP 429")
+    args = parser.parse_args()
+    server = StubAdsServer(args.port, args.latency, args.error_rate, args.rate_limit)
+    print("stub ADS API at {}".format(server.url))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
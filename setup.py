@@ -57,7 +57,6 @@ setup(
         "bibtexparser>=1.3.0,<2.0.0a0",
         "requests>=2.0",
         "packaging>=17.0",
-        "joblib>=1.0",
         "future>=0.12.0 ; python_version < '3.0'",
     ],
     entry_points={"console_scripts": ["adstex=adstex:main"]},
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "benchmarks"))
+from stub_ads import StubAdsServer  # noqa: E402
+
+import adstex  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    server = StubAdsServer().start()
+    StubAdsServer.patch_ads(server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stub_ads(stub_server, monkeypatch, tmp_path):
+    # the stub ADS server, with fresh counters, and a cache directory of the test's own
+    monkeypatch.setenv("ADS_API_TOKEN", "test")
+    monkeypatch.setenv("ADSTEX_CACHE_DIR", str(tmp_path / "cache"))
+    stub_server.reset_counters()
+    return stub_server
+
+
+@pytest.fixture
+def use_config():
+    # use_config(config) makes `config` the config of the test; it is closed at the end of the test
+    used = []
+
+    def use(config):
+        used.append((adstex._CONFIG.set(config), config))
+        return config
+
+    yield use
+    for token, config in reversed(used):
+        adstex._CONFIG.reset(token)
+        config.close()
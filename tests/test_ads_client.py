@@ -0,0 +1,35 @@
+import threading
+import time
+
+import adstex
+
+
+def test_concurrency_is_capped_at_thread_pool_size():
+    client = adstex.AdsClient(max_concurrency=300)
+    try:
+        assert client.max_concurrency == adstex._ADS_MAX_THREADS
+        assert client.executor._max_workers == adstex._ADS_MAX_THREADS
+    finally:
+        client.close()
+
+
+def test_async_calls_respect_rate_limit_window():
+    client = adstex.AdsClient(max_concurrency=8)
+    client._allowed = 2  # as after a 429 response
+    lock = threading.Lock()
+    running = [0, 0]  # current, highest
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return i
+
+    try:
+        assert client.map(work, range(10)) == list(range(10))
+    finally:
+        client.close()
+    assert running[1] == 2
@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager
+
+import adstex
+
+
+@contextmanager
+def _run(argv):
+    # the config of a run of adstex with the cache options in `argv`; closed (and the cache expired) on exit
+    parser = adstex._build_parser()
+    args = adstex._parse_args(parser, argv + ["--ignore-env-args", "refs.bib"])
+    config = adstex._make_config(args)
+    adstex._open_stores(config, args, parser)
+    token = adstex._CONFIG.set(config)
+    try:
+        yield config
+    finally:
+        adstex._CONFIG.reset(token)
+        config.close()
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_expires_each_kind_by_its_ttl(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(time, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    cache = adstex.AdsCache(path, ttl={"bibtex": 3})
+    cache.set("id", "10.1000/a", "2019ApJ...871....1S")
+    cache.set("bibtex", "2019ApJ...871....1S", "@ARTICLE{...}")
+
+    clock.now += 2 * 86400.0  # past the default TTL of "id", within the TTL of "bibtex"
+    assert cache.get("id", "10.1000/a") is None
+    assert cache.get("bibtex", "2019ApJ...871....1S") == "@ARTICLE{...}"
+    cache.close()
+
+    clock.now -= 2 * 86400.0  # the expired rows were deleted on close
+    cache = adstex.AdsCache(path)
+    assert cache.get("id", "10.1000/a") is None
+    assert cache.get("bibtex", "2019ApJ...871....1S") == "@ARTICLE{...}"
+    cache.close()
+
+
+def test_cache_trims_each_kind_to_the_most_recently_used(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(time, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    cache = adstex.AdsCache(path, max_entries=2)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set("id", key, key.upper())
+    cache.set("bibtex", "A", "@ARTICLE{A}")
+    clock.now += 1
+    assert cache.get("id", "a") == "A"  # "b" is now the least recently used
+    cache.close()
+
+    cache = adstex.AdsCache(path, max_entries=2)
+    assert cache.get_many("id", ["a", "b", "c"]) == {"a": "A", "c": "C"}
+    assert cache.get("bibtex", "A") == "@ARTICLE{A}"
+    cache.close()
+
+    cache = adstex.AdsCache(path, refresh=True)
+    assert cache.get("id", "a") is None and cache.misses["id"] == 1
+    cache.set("id", "a", "A2")
+    cache.close()
+    cache = adstex.AdsCache(path)
+    assert cache.get("id", "a") == "A2"
+    cache.close()
+
+
+def test_checked_records_survive_cache_ttl(stub_ads):
+    entries = {"Smith2015": {"ID": "Smith2015", "adsurl": "https://ui.adsabs.harvard.edu/abs/2015ApJ...800....1S"}}
+    with _run([]) as config:
+        adstex.record_checked(["2015ApJ...800....1S"])
+        config.cache.set("id", "10.1000/xyz", "2015ApJ...800....1S")
+
+    for argv in (["--cache-ttl", "0"], ["--refresh-cache"], []):
+        with _run(argv) as config:
+            assert adstex.fresh_keys(entries) == {"Smith2015"}
+    with _run([]) as config:
+        assert config.cache.get("id", "10.1000/xyz") is None  # expired by --cache-ttl 0
+
+
+def test_checked_records_are_not_trimmed(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    now = time.time()
+    cache = adstex.AdsCache(path, max_entries=1)
+    cache.set_many("checked", [("2015ApJ...800....1S", now), ("2015ApJ...800....2S", now)])
+    cache.set_many("id", [("a", "2015ApJ...800....1S"), ("b", "2015ApJ...800....2S")])
+    cache.close()
+
+    cache = adstex.AdsCache(path, max_entries=1)
+    assert len(cache.get_many("checked", ["2015ApJ...800....1S", "2015ApJ...800....2S"])) == 2
+    assert len(cache.get_many("id", ["a", "b"])) == 1
+    cache.close()
@@ -0,0 +1,31 @@
+import pytest
+
+import adstex
+
+
+@pytest.fixture
+def parse(monkeypatch):
+    monkeypatch.delenv("ADSTEX_ARGS", raising=False)
+    return lambda argv: adstex._parse_args(adstex._build_parser(), argv)
+
+
+def test_watch_does_not_take_the_tex_file(parse):
+    args = parse(["--watch", "paper.tex"])
+    assert args.watch and args.watch_interval == 1.0
+    assert args.files == ["paper.tex"]
+
+    args = parse(["--watch", "--watch-interval", "0.5", "paper.tex"])
+    assert args.watch and args.watch_interval == 0.5
+    assert args.files == ["paper.tex"]
+
+
+def test_auto_select_does_not_take_the_tex_file(parse):
+    args = parse(["--auto-select", "paper.tex"])
+    assert args.auto_threshold == adstex._AUTO_THRESHOLD
+    assert args.files == ["paper.tex"]
+
+    args = parse(["--auto-threshold", "0.8", "paper.tex"])
+    assert args.auto_threshold == 0.8
+    assert args.files == ["paper.tex"]
+
+    assert parse(["paper.tex"]).auto_threshold is None
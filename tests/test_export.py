@@ -0,0 +1,30 @@
+import adstex
+
+
+def test_force_regenerate_skips_cached_bibtex(stub_ads, use_config, tmp_path):
+    cache = adstex.AdsCache(str(tmp_path / "cache.sqlite"))
+    bibcode = "2019ApJ...871....1S"
+    cache.set("bibtex", bibcode, "@ARTICLE{%s,\n title = {Old},\n}" % bibcode)
+
+    config = use_config(adstex.Config(cache=cache))
+    bib, failed = adstex.export_bibtex([bibcode])
+    assert bib.entries[0]["title"] == "Old" and stub_ads.requests["export"] == 0
+
+    config.force_regenerate = True
+    bib, failed = adstex.export_bibtex([bibcode])
+    assert not failed and bib.entries[0]["title"] != "Old"
+    assert stub_ads.requests["export"] == 1
+    assert "Old" not in cache.get("bibtex", bibcode)
+
+
+def test_corrupt_cached_bibtex_is_exported_again(stub_ads, use_config, tmp_path):
+    cache = adstex.AdsCache(str(tmp_path / "cache.sqlite"))
+    good, corrupt = "2019ApJ...871....1S", "2019ApJ...872....2S"
+    cache.set("bibtex", good, "@ARTICLE{%s,\n title = {Good},\n}" % good)
+    cache.set("bibtex", corrupt, "@ARTICLE{%s,\n title = {Corrupt" % corrupt)
+    use_config(adstex.Config(cache=cache))
+
+    bib, failed = adstex.export_bibtex([good, corrupt])
+    assert not failed
+    assert sorted(entry["ID"] for entry in bib.entries) == sorted([good, corrupt])
+    assert stub_ads.requests["export"] == 1
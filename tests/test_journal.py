@@ -0,0 +1,49 @@
+import os
+
+import adstex
+
+HEADER = {"outputs": ["refs.bib"], "hashes": {"refs.bib": "0123"}, "options": {"update": True}}
+
+
+def _interrupted_run(path):
+    journal = adstex.RunJournal(path, HEADER)
+    journal.record_lookups([((0, "k1"), "2019ApJ...871....1S"), ((0, "k2"), None)])
+    journal.record_answer((1, "Smith2019"), "2019ApJ...872....2S")
+    journal.record_export({"2019ApJ...871....1S": "@ARTICLE{2019ApJ...871....1S}"})
+    journal.close(remove=False)
+    with open(path, "a") as fp:
+        fp.write('{"type": "answer", "key": [1, "Doe20')  # cut short by the interruption
+
+
+def test_resume_loads_the_records_of_an_interrupted_run(tmp_path):
+    path = str(tmp_path / "refs.bib.adstex-journal")
+    _interrupted_run(path)
+
+    journal = adstex.RunJournal(path, HEADER, resume=True)
+    assert journal.resumed
+    assert journal.lookups == {(0, "k1"): "2019ApJ...871....1S", (0, "k2"): None}
+    assert journal.answers == {(1, "Smith2019"): "2019ApJ...872....2S"}
+    assert journal.bibtex == {"2019ApJ...871....1S": "@ARTICLE{2019ApJ...871....1S}"}
+    journal.record_answer((1, "Doe2020"), None)
+    journal.close(remove=False)
+
+    journal = adstex.RunJournal(path, HEADER, resume=True)
+    assert journal.answers == {(1, "Smith2019"): "2019ApJ...872....2S", (1, "Doe2020"): None}
+    journal.close()
+    assert not os.path.exists(path)
+
+
+def test_resume_starts_over_when_the_run_differs(tmp_path, capsys):
+    path = str(tmp_path / "refs.bib.adstex-journal")
+    _interrupted_run(path)
+
+    journal = adstex.RunJournal(path, dict(HEADER, hashes={"refs.bib": "4567"}), resume=True)
+    assert not journal.resumed and not journal.lookups and not journal.answers
+    assert "starting over" in capsys.readouterr().out
+    journal.close(remove=False)
+
+    _interrupted_run(path)
+    journal = adstex.RunJournal(path, HEADER)  # without --resume
+    assert not journal.resumed and not journal.lookups
+    assert "Discarding" in capsys.readouterr().out
+    journal.close()
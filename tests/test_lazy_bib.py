@@ -0,0 +1,29 @@
+import io
+
+import adstex
+
+
+def test_lazy_bib_scans_file_through_mmap(tmp_path):
+    path = str(tmp_path / "other.bib")
+    with io.open(path, "w", encoding="utf8") as fp:
+        fp.write(
+            u'@string{jnl = "Journal"}\n'
+            u"% @article{commented, doi={10.1000/no}}\n"
+            u"@article{Müller2019, journal=jnl, doi={10.1000/xyz}} @misc{b, eprint={1901.00001}}\n"
+            u"@book{noid, title={Über}}\n"
+        )
+
+    db = adstex.LazyBibDatabase([path])
+    assert sorted(db.entries_dict) == sorted([u"Müller2019", "b", "noid"])
+    assert sorted((e["ID"], e.get("doi"), e.get("eprint")) for e in db.id_entries()) == [
+        (u"Müller2019", "10.1000/xyz", None),
+        ("b", None, "1901.00001"),
+    ]
+    assert db.entries_dict[u"Müller2019"]["journal"] == "Journal"
+    assert db.entries_dict["noid"]["title"] == u"Über"
+
+
+def test_lazy_bib_empty_file(tmp_path):
+    path = tmp_path / "empty.bib"
+    path.write_text("")
+    assert len(adstex.LazyBibDatabase([str(path)]).entries_dict) == 0
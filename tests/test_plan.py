@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+import adstex
+
+BIB = """
+@ARTICLE{Old,
+  doi = {10.1000/j},
+  adsurl = {https://ui.adsabs.harvard.edu/abs/2015ApJ...800....1S},
+}
+
+@ARTICLE{Pre,
+  eprint = {2101.00001},
+  adsurl = {https://ui.adsabs.harvard.edu/abs/2021arXiv210100001S},
+}
+"""
+
+
+def test_defer_refreshes_keeps_new_keys_and_likely_updates_first(tmp_path, monkeypatch, use_config):
+    use_config(adstex.Config())
+    monkeypatch.setattr(adstex, "_ID_CHUNK_SIZE", 1)
+    monkeypatch.setattr(adstex, "_EXPORT_CHUNK_SIZE", 1)
+    (tmp_path / "refs.bib").write_text(BIB)
+    project = adstex._Project([], str(tmp_path / "refs.bib"), keys=["Old", "Pre", "2102.00002"])
+    project.load()
+    lookups, local = project.lookups()
+    lookups = OrderedDict(((0, key), ids) for key, ids in lookups.items())
+
+    plan = adstex.RequestPlan([project], lookups, [local])
+    assert plan.refreshes == {(0, "Old"), (0, "Pre")}
+    # the new key: 1 identifier search and 1 export; each existing entry: 2 identifier searches and 1 export
+    assert plan.total == 8
+    assert plan.defer_refreshes(8) == set()
+    assert plan.defer_refreshes(5) == {(0, "Old")}  # the preprint is more likely to have changed
+    assert plan.defer_refreshes(4) == {(0, "Old"), (0, "Pre")}
+
+    pending = adstex._defer_refreshes(plan, [project], list(lookups.items()), 5)
+    assert [key for key, _ in pending] == [(0, "2102.00002"), (0, "Pre")]
+    assert project.deferred == {"Old"}
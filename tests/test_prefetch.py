@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+import adstex
+
+_KEYS = ["Smith2019", "Jones2018", "Lee2017", "Wang2016"]
+
+
+@pytest.fixture
+def slow_ads(stub_ads):
+    stub_ads.latency = 0.2
+    yield stub_ads
+    stub_ads.latency = 0.0
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+def test_prefetch_runs_in_background(slow_ads, use_config, max_concurrency):
+    use_config(adstex.Config(client=adstex.AdsClient(max_concurrency=max_concurrency)))
+    t = time.perf_counter()
+    prefetched = adstex.prefetch_authoryear(_KEYS)
+    assert time.perf_counter() - t < 0.1  # returns before any search is done
+    assert all(len(prefetched[key].result()) == slow_ads.candidates for key in _KEYS)
+    elapsed = time.perf_counter() - t
+    if max_concurrency == 1:
+        assert elapsed >= 0.2 * len(_KEYS)
+    else:  # the searches overlap
+        assert elapsed < 0.2 * len(_KEYS) * 0.75
+    assert slow_ads.requests["authoryear"] == len(_KEYS)
@@ -0,0 +1,68 @@
+import ads
+import pytest
+from stub_ads import fake_bibcode
+
+import adstex
+
+
+@pytest.fixture
+def client(stub_ads, use_config):
+    return use_config(adstex.Config(client=adstex.AdsClient(max_concurrency=4))).client
+
+
+class _Record(object):
+    def __init__(self, **fields):
+        self._fields = fields
+
+    def items(self):
+        return self._fields.items()
+
+
+def _patch_batched_search(monkeypatch, batched):
+    # `batched(q)` answers the batched identifier searches; the one-by-one searches go to the stub
+    search = adstex.fixedAdsSearchQuery
+
+    def patched(*args, **kwargs):
+        if kwargs.get("q", "").startswith("identifier:("):
+            return batched(kwargs["q"])
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(adstex, "fixedAdsSearchQuery", patched)
+
+
+def test_identifiers_are_resolved_in_batches(stub_ads, client):
+    ids = ["10.1000/a", "10.1000/b", "2101.00001", "2101.00002", "2019ApJ...871....1S"]
+    resolved, failed = adstex.ids2bibcodes(ids, chunk_size=2)
+    assert resolved == {id_this: fake_bibcode(id_this) for id_this in ids} and not failed
+    assert stub_ads.requests["identifier"] == 3
+
+    stub_ads.reset_counters()
+    resolved, failed = adstex.batch_id2bibcode({"k1": ["10.1000/c", "2101.00003"], "k2": ["10.1000/d"]})
+    assert resolved == {"k1": fake_bibcode("10.1000/c"), "k2": fake_bibcode("10.1000/d")} and not failed
+    assert stub_ads.requests["identifier"] == 1
+
+
+def test_unmatched_records_fall_back_to_one_search_per_identifier(stub_ads, client, monkeypatch):
+    _patch_batched_search(monkeypatch, lambda q: [_Record(bibcode="2000Other...1....1X", identifier=[])])
+    ids = ["10.1000/a", "10.1000/b"]
+    resolved, failed = adstex._resolve_id_chunk(ids)
+    assert resolved == {id_this: fake_bibcode(id_this) for id_this in ids} and not failed
+    assert stub_ads.requests["identifier"] == 2
+
+
+def test_rejected_batch_falls_back_to_one_search_per_identifier(stub_ads, client, monkeypatch):
+    def batched(q):
+        raise ads.exceptions.APIResponseError("malformed query")
+
+    _patch_batched_search(monkeypatch, batched)
+    ids = ["10.1000/a", "10.1000/b"]
+    resolved, failed = adstex._resolve_id_chunk(ids)
+    assert resolved == {id_this: fake_bibcode(id_this) for id_this in ids} and not failed
+    assert stub_ads.requests["identifier"] == 2
+
+
+def test_keys_are_failed_when_ads_is_unavailable(stub_ads, use_config):
+    use_config(adstex.Config(client=adstex.AdsClient(offline=True)))
+    resolved, failed = adstex.batch_id2bibcode({"k1": ["10.1000/a"], "k2": ["10.1000/b"]})
+    assert resolved == {} and failed == {"k1", "k2"}
+    assert stub_ads.requests["identifier"] == 0
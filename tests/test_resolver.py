@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+from stub_ads import fake_bibcode
+
+import adstex
+
+
+@pytest.fixture
+def resolver(stub_ads):
+    resolver = adstex.Resolver(adstex.Config(client=adstex.AdsClient(max_concurrency=4)))
+    yield resolver
+    resolver.config.close()
+
+
+def test_resolve(stub_ads, resolver):
+    results = resolver.resolve(["Smith2019", "2404.14498"])
+    assert [(r.key, r.status) for r in results] == [("2404.14498", "new"), ("Smith2019", "interactive")]
+    new, interactive = results
+    assert new.bibcode == fake_bibcode("2404.14498") and new.entry["ID"] == "2404.14498"
+    assert len(interactive.candidates) == stub_ads.candidates and interactive.entry is None
+    assert adstex._CONFIG.get() is None  # the config is only set during the call
+
+    results = resolver.resolve(["Smith2019"], answers={"Smith2019": "2101.00001"})
+    assert [(r.status, r.bibcode, r.entry["ID"]) for r in results] == [("new", fake_bibcode("2101.00001"), "Smith2019")]
+
+    resolver.config.auto_threshold = 0.01
+    (result,) = resolver.resolve(["Smith2019"])
+    assert result.status == "new" and result.bibcode == interactive.candidates[0].bibcode
+
+
+def test_aresolve_runs_jobs_concurrently(stub_ads, resolver):
+    stub_ads.latency = 0.2
+
+    async def run():
+        return await asyncio.gather(*(resolver.aresolve(["{}.00001".format(2100 + i)]) for i in range(4)))
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        stub_ads.latency = 0.0
+    assert [[(r.status, r.bibcode) for r in rs] for rs in results] == [
+        [("new", fake_bibcode("{}.00001".format(2100 + i)))] for i in range(4)
+    ]
+    # each job sends an identifier search and an export; run one after another, they would take 8 x 0.2 s
+    assert elapsed < 4 * 0.2 * 1.5
@@ -0,0 +1,52 @@
+import os
+import time
+
+import adstex
+
+
+def test_scan_tex_finds_keys_bib_and_includes():
+    text = (
+        "See \\cite{a, b} and \\citep[see][p.~1]{c}; \\citet*{d} 50\\% \\cite{e}.\n"
+        "% \\cite{commented}\n"
+        "\\bibentry{f}\n"
+        "\\input{sections/intro}\n"
+        "\\include{chapter}\n"
+        "\\import{parts/}{methods}\n"
+        "\\bibliography{refs,other}\n"
+    )
+    assert adstex._scan_tex(text) == {
+        "keys": ["a", "b", "c", "d", "e", "f"],
+        "bib": ["refs", "other"],
+        "includes": ["sections/intro", "chapter", os.path.join("parts/", "methods")],
+    }
+
+
+def test_scan_tex_is_linear_on_unclosed_arguments():
+    # unclosed optional arguments and groups must not make the scan go back over the rest of the text
+    def best_time(text):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            adstex._scan_tex(text)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    for unit in ("\\cite[a ", "\\citep[x][y]{", "\\input{"):
+        assert best_time(unit * 20000) < 10 * best_time(unit * 5000)
+
+
+def test_search_keys_follows_includes(tmp_path, use_config):
+    use_config(adstex.Config())
+    (tmp_path / "sections").mkdir()
+    (tmp_path / "main.tex").write_text("\\cite{a}\n\\input{sections/intro}\n\\bibliography{refs}\n")
+    # included files are looked up from the root directory, and include each other in a cycle
+    (tmp_path / "sections" / "intro.tex").write_text("\\cite{b}\n\\include{sections/more}\n")
+    (tmp_path / "sections" / "more.tex").write_text("\\cite{c}\n\\input{sections/intro}\n\\input{missing}\n")
+
+    visited = set()
+    keys, bib = adstex.search_keys([str(tmp_path / "main.tex")], find_bib=True, visited=visited)
+    assert keys == {"a", "b", "c"}
+    assert bib == [os.path.join(str(tmp_path), "refs.bib")]
+    assert visited == set(
+        os.path.realpath(str(tmp_path / name)) for name in ("main.tex", "sections/intro.tex", "sections/more.tex")
+    )
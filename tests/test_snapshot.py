@@ -0,0 +1,73 @@
+import pytest
+
+import adstex
+
+EXPORT = """
+@ARTICLE{2019ApJ...871....1S,
+  author = {{Smith}, A. and {van der Berg}, B.},
+  title = "{A paper}",
+  year = 2019,
+  doi = {10.1000/a},
+  eprint = {1901.00001},
+  adsurl = {https://ui.adsabs.harvard.edu/abs/2019ApJ...871....1S},
+}
+
+@ARTICLE{2019MNRAS.480....2S,
+  author = {{Smith}, C.},
+  title = "{Another paper}",
+  year = 2019,
+}
+
+@ARTICLE{local,
+  author = {{Doe}, J.},
+  year = 2019,
+}
+"""
+
+
+def test_snapshot_round_trip(tmp_path):
+    (tmp_path / "export.bib").write_text(EXPORT)
+    path = str(tmp_path / "ads.snapshot")
+    # the second file repeats a record, which is kept once
+    assert adstex.build_snapshot(path, [str(tmp_path / "export.bib")] * 2) == 2
+
+    snapshot = adstex.AdsSnapshot(path)
+    try:
+        assert len(snapshot) == 2
+        for id_this in ("2019ApJ...871....1S", "10.1000/a", "DOI:10.1000/A", "arXiv:1901.00001"):
+            assert snapshot.id2bibcode(id_this) == "2019ApJ...871....1S"
+        assert snapshot.id2bibcode("10.1000/missing") is None
+
+        texts = snapshot.bibtex(["2019ApJ...871....1S", "2019MNRAS.480....2S", "2000Other...1....1X"])
+        assert sorted(texts) == ["2019ApJ...871....1S", "2019MNRAS.480....2S"]
+        assert "{A paper}" in texts["2019ApJ...871....1S"]
+
+        assert sorted(c.bibcode for c in snapshot.search_authoryear("Smith", "2019")) == [
+            "2019ApJ...871....1S",
+            "2019MNRAS.480....2S",
+        ]
+        candidates = snapshot.search_authoryear("Smith", "2019", ["van der Berg"])
+        assert [(c.bibcode, c.author, c.title) for c in candidates] == [
+            ("2019ApJ...871....1S", ["Smith, A.", "van der Berg, B."], ["A paper"])
+        ]
+        assert snapshot.search_authoryear("Smith", "2020") == []
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    (tmp_path / "export.bib").write_text(EXPORT)
+    with pytest.raises(ValueError):
+        adstex.AdsSnapshot(str(tmp_path / "export.bib"))
+
+
+def test_offline_lookups_read_the_snapshot(tmp_path, use_config):
+    (tmp_path / "export.bib").write_text(EXPORT)
+    path = str(tmp_path / "ads.snapshot")
+    adstex.build_snapshot(path, [str(tmp_path / "export.bib")])
+    use_config(adstex.Config(client=adstex.AdsClient(offline=True), snapshot=adstex.AdsSnapshot(path)))
+
+    resolved, failed = adstex.batch_id2bibcode({"a": ["10.1000/a"], "b": ["10.1000/b"]})
+    assert resolved == {"a": "2019ApJ...871....1S"} and failed == {"b"}
+    bib, failed = adstex.export_bibtex(["2019MNRAS.480....2S"])
+    assert [entry["ID"] for entry in bib.entries] == ["2019MNRAS.480....2S"] and not failed
@@ -0,0 +1,54 @@
+import bibtexparser
+
+import adstex
+
+
+def _keys_of(text):
+    return [entry["ID"] for entry in bibtexparser.loads(text, parser=adstex.get_bparser()).entries]
+
+
+def _keys(path):
+    with open(path) as fp:
+        return _keys_of(fp.read())
+
+
+def test_scan_bib_spans_matches_parser():
+    text = (
+        "% @article{commented, title={x}}\n"
+        "@article{a, title={x}} @article{b, title={y (z}}\n"
+        "@comment{ @article{skipped, title={x}} }\n"
+        "@string{foo = \"bar\"}@book(c, title=foo)\n"
+        "@preamble{\"x\"}\n"
+    )
+    strings = []
+    spans = adstex._scan_bib_spans(text, strings)
+    assert sorted(spans) == sorted(_keys_of(text))
+    for start, end in spans.values():
+        assert text[start] == "@" and text[end - 1] in "})"
+    assert [text[start:end] for start, end in strings] == ['@string{foo = "bar"}']
+
+
+def test_write_bib_replaces_entry_that_starts_mid_line(tmp_path):
+    path = str(tmp_path / "refs.bib")
+    with open(path, "w") as fp:
+        fp.write("@article{a, title={A}} @article{b, title={B}}\n% keep me\n")
+
+    assert adstex.write_bib(path, [{"ENTRYTYPE": "article", "ID": "b", "title": "New B"}], backup=False)
+    with open(path) as fp:
+        text = fp.read()
+    assert _keys(path) == ["a", "b"]
+    assert "New B" in text and "title={B}" not in text
+    assert text.startswith("@article{a, title={A}} ") and "% keep me" in text
+
+
+def test_write_bib_appends_new_entry_and_keeps_the_rest(tmp_path):
+    path = str(tmp_path / "refs.bib")
+    original = "@string{x = \"X\"}\n\n@article{a,\n  title = x\n}\n"
+    with open(path, "w") as fp:
+        fp.write(original)
+
+    assert adstex.write_bib(path, [{"ENTRYTYPE": "misc", "ID": "c", "title": "C"}], backup=False)
+    with open(path) as fp:
+        assert fp.read().startswith(original)
+    assert _keys(path) == ["a", "c"]
+    assert not adstex.write_bib(path, [{"ENTRYTYPE": "misc", "ID": "c", "title": "C"}], backup=False)